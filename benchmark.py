@@ -0,0 +1,294 @@
+"""Timing benchmarks for the simulation's hot paths.
+
+Runs every stage at a range of map sizes and fleet sizes with fixed seeds
+and writes the results as JSON, e.g.
+
+    python benchmark.py --sizes 100 200 --fleets 1 100 --output bench.json
+    python benchmark.py --sizes 100 200 --fleets 1 100 --compare bench.json
+
+Stages that build one Cell per road cell and one Car per vehicle are
+skipped, and recorded as skipped, once they would exceed --max-grid-size
+or --object-budget. Routing is timed on --route-samples pairs per map
+size first; every stage that routes a whole fleet (batch_routes,
+ReplicaEngine, Grid.update) is skipped when that estimate puts its
+routing above --route-seconds.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from roads import City
+from grid import Grid
+from car import Car
+from routing import LaneGraph, batch_routes
+from replicas import ReplicaEngine
+from console import quiet
+
+
+CITY_ARGS = dict(block_size_range=(10, 30), base_road_width=2, wide_road_width=4,
+                 highway_width=6, road_remove=0.2)
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []
+
+    def add(self, name, size, fleet=None, seconds=None, skipped=None, **extra):
+        entry = {'name': name, 'size': size, 'fleet': fleet}
+        if skipped is not None:
+            entry['skipped'] = skipped
+        else:
+            entry['seconds'] = seconds
+            entry['min'] = min(seconds)
+            entry['mean'] = sum(seconds) / len(seconds)
+        entry.update(extra)
+        self.results.append(entry)
+        label = f"{name:<18} size={size:<6} fleet={fleet if fleet is not None else '-':<7}"
+        if skipped is not None:
+            print(f"{label} skipped ({skipped})", file=sys.stderr)
+        else:
+            print(f"{label} min={entry['min']:.6f}s mean={entry['mean']:.6f}s", file=sys.stderr)
+
+
+def _pairs(city, fleet, seed):
+    rng = np.random.default_rng(seed)
+    local = np.argwhere((city.grid == 2) & ~city.intersections)
+    starts = local[rng.choice(len(local), fleet, replace=fleet > len(local))]
+    dests = local[rng.choice(len(local), fleet)]
+    return starts, dests
+
+
+def bench_city(rec, size, args):
+    _seed(args.seed)
+    city = City(width=size, height=size, **CITY_ARGS)
+    rec.add('generateRoads', size, seconds=_time(city.generateRoads, 1))
+    rec.add('_assign_light_masks', size, seconds=_time(city._assign_light_masks, args.repeat))
+    rec.add('LaneGraph', size, seconds=_time(lambda: LaneGraph(city), args.repeat))
+    return city
+
+
+def _too_slow(fleet, per_route, args):
+    # Skip reason for a stage that routes `fleet` cars, None if it fits the budget
+    if fleet * per_route > args.route_seconds:
+        return f'routing ~{fleet * per_route:.0f}s > --route-seconds {args.route_seconds:g}'
+    return None
+
+
+def bench_routing(rec, size, city, args):
+    """Time batch_routes per fleet; returns the seconds per route on a fixed sample."""
+    graph = LaneGraph(city)
+    starts, dests = _pairs(city, args.route_samples, args.seed)
+    seconds = _time(lambda: batch_routes(graph, starts, dests, processes=args.processes), 1)
+    per_route = min(seconds) / args.route_samples
+    rec.add('batch_routes', size, args.route_samples, seconds=seconds, processes=args.processes,
+            routes=args.route_samples, per_route=per_route)
+
+    for fleet in args.fleets:
+        if fleet == args.route_samples:
+            continue
+        skipped = _too_slow(fleet, per_route, args)
+        if skipped:
+            rec.add('batch_routes', size, fleet, skipped=skipped)
+            continue
+        starts, dests = _pairs(city, fleet, args.seed)
+        seconds = _time(lambda: batch_routes(graph, starts, dests, processes=args.processes), 1)
+        rec.add('batch_routes', size, fleet, seconds=seconds, processes=args.processes,
+                routes=fleet, per_route=min(seconds) / fleet)
+    return per_route
+
+
+def bench_grid(rec, size, per_route, args):
+    if size > args.max_grid_size:
+        for name in ('Grid', 'roadsToGrid', 'get_image', 'a_star_search'):
+            rec.add(name, size, skipped=f'size > --max-grid-size {args.max_grid_size}')
+        for fleet in args.fleets:
+            rec.add('Grid.update', size, fleet, skipped=f'size > --max-grid-size {args.max_grid_size}')
+        return
+
+    built = []
+    _seed(args.seed)
+    with quiet():
+        rec.add('Grid', size, seconds=_time(lambda: built.append(Grid(size, size)), 1))
+        # roadsToGrid replaces the index and cells, so time it on a throwaway Grid
+        _seed(args.seed)
+        scratch = Grid(size, size)
+        rec.add('roadsToGrid', size, seconds=_time(scratch.roadsToGrid, 1))
+        del scratch
+    grid = built[0]
+    rec.add('get_image', size, seconds=_time(grid.get_image, args.repeat))
+
+    # Single-car search, the way Car.compute_path does it
+    starts, dests = _pairs(grid.city, args.search_samples, args.seed)
+    cars = []
+    for k, (s, d) in enumerate(zip(starts, dests)):
+        car = Car(k, tuple(s), tuple(d), grid)
+        grid.cell(s[0], s[1]).leaving()
+        cars.append(car)
+    # Stop early once --route-seconds is spent; per_route stays comparable
+    start = time.perf_counter()
+    done = 0
+    for car in cars:
+        car.a_star_search()
+        done += 1
+        if time.perf_counter() - start > args.route_seconds:
+            break
+    seconds = time.perf_counter() - start
+    rec.add('a_star_search', size, seconds=[seconds], routes=done, per_route=seconds / max(done, 1))
+    del cars
+
+    for fleet in args.fleets:
+        # One Cell per road cell plus one Car per vehicle, all sharing one index
+        if grid.index.size + fleet > args.object_budget:
+            rec.add('Grid.update', size, fleet,
+                    skipped=f'road cells + fleet > --object-budget {args.object_budget:g}')
+            continue
+        # The spawn wave is routed before the timed ticks
+        skipped = _too_slow(fleet, per_route, args)
+        if skipped:
+            rec.add('Grid.update', size, fleet, skipped=skipped)
+            continue
+        _seed(args.seed)
+        with quiet():
+            grid = Grid(size, size)
+            _spawn(grid, fleet, args.seed)
+            # fleet is the requested size; cars is what fit on the local roads
+            rec.add('Grid.update', size, fleet,
+                    seconds=_time(lambda: _ticks(grid, args.ticks), 1), ticks=args.ticks,
+                    cars=len(grid.cars))
+
+
+def _spawn(grid, fleet, seed):
+    starts, dests = _pairs(grid.city, fleet, seed)
+    new = []
+    for s, d in zip(map(tuple, starts.tolist()), map(tuple, dests.tolist())):
+        if len(grid.cars) + len(new) >= fleet:
+            break
+        if grid.cell(*s).isOccupied() or s == d:
+            continue
+        new.append(Car(len(grid.cars) + len(new), s, d, grid))
+    grid.route_cars(new, processes=1)
+    for car in new:
+        grid.cars.append(car)
+        grid.scheduler.add(car)
+
+
+def _ticks(grid, ticks):
+    for i in range(ticks):
+        grid.update(i % 10 == 0)
+
+
+def bench_replicas(rec, size, city, per_route, args):
+    local = int(((city.grid == 2) & ~city.intersections).sum())
+    for fleet in args.fleets:
+        skipped = f'only {local} local road cells' if fleet >= local else _too_slow(fleet, per_route, args)
+        if skipped:
+            for name in ('ReplicaEngine', 'ReplicaEngine.step'):
+                rec.add(name, size, fleet, skipped=skipped)
+            continue
+        built = []
+        # Building the engine includes batch routing of its spawn wave
+        rec.add('ReplicaEngine', size, fleet,
+                seconds=_time(lambda: built.append(ReplicaEngine(city, 1, fleet, seeds=[args.seed],
+                                                                 route_processes=args.processes)), 1),
+                includes='batch_routes', routes=fleet)
+        engine = built[0]
+        rec.add('ReplicaEngine.step', size, fleet,
+                seconds=_time(lambda: engine.run(args.ticks), 1), ticks=args.ticks)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old_path, results):
+    with open(old_path) as f:
+        old = {(r['name'], r['size'], r['fleet']): r for r in json.load(f)['results'] if 'min' in r}
+    # stderr, so the table never mixes with a JSON report written to stdout
+    print(f"{'stage':<20}{'size':>7}{'fleet':>8}{'old':>12}{'new':>12}{'ratio':>8}", file=sys.stderr)
+    for r in results:
+        key = (r['name'], r['size'], r['fleet'])
+        if 'min' not in r or key not in old:
+            continue
+        ratio = r['min'] / old[key]['min'] if old[key]['min'] > 0 else float('inf')
+        fleet = '-' if r['fleet'] is None else r['fleet']
+        print(f"{r['name']:<20}{r['size']:>7}{fleet:>8}{old[key]['min']:>12.6f}{r['min']:>12.6f}{ratio:>8.2f}",
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the traffic simulation.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 200, 500, 1000, 2000, 5000])
+    parser.add_argument('--fleets', type=int, nargs='+', default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--ticks', type=int, default=20)
+    parser.add_argument('--search-samples', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--max-grid-size', type=int, default=1000)
+    parser.add_argument('--route-samples', type=int, default=20,
+                        help="pairs routed per map size to estimate the time per route")
+    parser.add_argument('--route-seconds', type=float, default=60,
+                        help="skip stages whose estimated fleet routing exceeds this")
+    parser.add_argument('--object-budget', type=float, default=5e6,
+                        help="skip Grid.update when road cells + fleet exceeds this")
+    parser.add_argument('--output', default='-', help="JSON file, '-' for stdout")
+    parser.add_argument('--compare', help="previous JSON output to compare against")
+    args = parser.parse_args(argv)
+
+    rec = Recorder()
+    for size in args.sizes:
+        city = bench_city(rec, size, args)
+        per_route = bench_routing(rec, size, city, args)
+        bench_replicas(rec, size, city, per_route, args)
+        bench_grid(rec, size, per_route, args)
+
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'args': vars(args),
+        },
+        'results': rec.results,
+    }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        compare(args.compare, rec.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,47 +2,46 @@ import numpy as np
 import random
 import heapq
 from cell import Cell
+import profiler
 
 class Car:
-    def __init__(self, car_id, start_pos, destination, city_grid):
+    def __init__(self, car_id, start_pos, destination, grid):
         self.car_id = car_id
         self.source = start_pos
         self.position = (start_pos[0], start_pos[1])
         self.destination = (destination[0], destination[1])
-        self.grid = city_grid
+        self.grid = grid
         self.path = []
         self.reached = False
         self.time_spent = 0
         self.move_probability = 0.90
         self.path_index = 0
+        self.blocked_on = None  # ('light', cluster) or ('cell', (y, x)) after a blocked update
+        self.parked_at = -1
+        self.edge_cost = None  # Shared travel cost per road index id, unit cost if None
 
-        start_cell_type = self.grid[self.position[0]][self.position[1]].cell_type
-        self.speed = start_cell_type / 2
-        self.grid[self.position[0]][self.position[1]].car_enters()
+        start_cell = grid.cell(*self.position)
+        self.speed = start_cell.cell_type / 2
+        start_cell.car_enters()
 
-        rows, cols = len(city_grid), len(city_grid[0])
-        self.ROW = rows
-        self.COL = cols
-        self.parent_i = np.full((rows, cols), -1, dtype=int)
-        self.parent_j = np.full((rows, cols), -1, dtype=int)
-        self.g = np.full((rows, cols), np.inf)
-        self.h = np.full((rows, cols), np.inf)
-        self.f = np.full((rows, cols), np.inf)
+        self.ROW = grid.height
+        self.COL = grid.width
+
+        # Search arrays over road cells only, shared by all cars on the index
+        self.index = grid.index
+        self.g, self.h, self.f, self.parent = self.index.search_buffers()
 
     def spawnCar(self):
         while True:
             row = random.randint(0, self.ROW - 1)
             col = random.randint(0, self.COL - 1)
-            if getattr(self.grid[row][col], 'is_road', False):
+            if getattr(self.grid.cell(row, col), 'is_road', False):
                 return (row, col)
 
     def is_within_grid(self, row, col):
         if not (0 <= row < self.ROW and 0 <= col < self.COL):
             return False
-        cell = self.grid[row][col]
-        if cell is None:
-            return False
-        return cell.getCellType() in (2, 3, 4, 6)
+        return self.is_road_cell(row, col)
 
     def is_destination(self, row, col):
         return row == self.destination[0] and col == self.destination[1]
@@ -51,13 +50,13 @@ class Car:
         return ((row - self.destination[0]) ** 2 + (col - self.destination[1]) ** 2) ** 0.5
 
     def is_road_cell(self, row, col):
-        cell = self.grid[row][col]
-        return cell is not None and cell.getCellType() in (2, 3, 4, 6)
+        cell_id = self.index.id_of(row, col)
+        return cell_id >= 0 and self.index.cell_type[cell_id] in (2, 3, 4, 6)
 
     def is_on_correct_lane(self, i, j, ni, nj):
         # Allow any move if current or next is an intersection
-        curr_type = self.grid[i][j].getCellType()
-        next_type = self.grid[ni][nj].getCellType()
+        curr_type = self.index.cell_type[self.index.id_of(i, j)]
+        next_type = self.index.cell_type[self.index.id_of(ni, nj)]
         if curr_type == 3 or next_type == 3:
             return True
 
@@ -109,11 +108,11 @@ class Car:
 
     def trace_path(self):
         path = []
-        row, col = self.destination
-        while not (self.parent_i[row, col] == row and self.parent_j[row, col] == col):
-            path.append((int(row), int(col)))
-            row, col = self.parent_i[row, col], self.parent_j[row, col]
-        path.append((int(row), int(col))) #change to int to output coordinates correctly
+        node = self.index.id_of(*self.destination)
+        while self.parent[node] != node:
+            path.append((int(self.index.ys[node]), int(self.index.xs[node])))
+            node = int(self.parent[node])
+        path.append((int(self.index.ys[node]), int(self.index.xs[node]))) #change to int to output coordinates correctly
         path.reverse()
         self.path = path[1:]
         return path
@@ -123,30 +122,33 @@ class Car:
         self.path = self.path[1:]
 
     def a_star_search(self):
-        self.g[:, :] = np.inf
-        self.h[:, :] = np.inf
-        self.f[:, :] = np.inf
-        self.parent_i[:, :] = -1
-        self.parent_j[:, :] = -1
+        self.g[:] = np.inf
+        self.h[:] = np.inf
+        self.f[:] = np.inf
+        self.parent[:] = -1
 
         i, j = self.position
-        self.g[i, j] = 0
-        self.h[i, j] = self.calculate_heuristic_value(i, j)
-        self.f[i, j] = self.h[i, j]
-        self.parent_i[i, j] = i
-        self.parent_j[i, j] = j
+        node = self.index.id_of(i, j)
+        self.g[node] = 0
+        self.h[node] = self.calculate_heuristic_value(i, j)
+        self.f[node] = self.h[node]
+        self.parent[node] = node
 
-        open_list = [(self.f[i, j], i, j)]
-        closed = np.full((self.ROW, self.COL), False, dtype=bool)
+        open_list = [(self.f[node], i, j)]
+        closed = np.full(self.index.size, False, dtype=bool)
 
         # Only orthogonal moves
         neighbors = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        expanded = 0
+        profiler.count('astar_searches')
 
         while open_list:
             _, i, j = heapq.heappop(open_list)
-            if closed[i, j]:
+            node = self.index.id_of(i, j)
+            if closed[node]:
                 continue
-            closed[i, j] = True
+            closed[node] = True
+            expanded += 1
 
             for di, dj in neighbors:
                 ni, nj = i + di, j + dj
@@ -157,26 +159,27 @@ class Car:
                 if not self.is_on_correct_lane(i, j, ni, nj):
                     continue
 
+                nxt = self.index.id_of(ni, nj)
                 if self.is_destination(ni, nj):
-                    self.parent_i[ni, nj] = i
-                    self.parent_j[ni, nj] = j
+                    self.parent[nxt] = node
+                    profiler.count('astar_expansions', expanded)
                     return self.trace_path()
 
-                if closed[ni, nj]:
+                if closed[nxt]:
                     continue
 
-                g_new = self.g[i, j] + 1
+                g_new = self.g[node] + (1 if self.edge_cost is None else self.edge_cost[nxt])
                 h_new = self.calculate_heuristic_value(ni, nj)
                 f_new = g_new + h_new
 
-                if self.f[ni, nj] > f_new:
-                    self.f[ni, nj] = f_new
-                    self.g[ni, nj] = g_new
-                    self.h[ni, nj] = h_new
-                    self.parent_i[ni, nj] = i
-                    self.parent_j[ni, nj] = j
+                if self.f[nxt] > f_new:
+                    self.f[nxt] = f_new
+                    self.g[nxt] = g_new
+                    self.h[nxt] = h_new
+                    self.parent[nxt] = node
                     heapq.heappush(open_list, (f_new, ni, nj))
 
+        profiler.count('astar_expansions', expanded)
         return [self.position] if not self.reached else []
 
     def update(self):
@@ -184,7 +187,8 @@ class Car:
         print("Current Speed: " , self.speed)
 
         current_y, current_x = self.position
-        current_cell = self.grid[current_y][current_x]
+        current_cell = self.grid.cell(current_y, current_x)
+        self.blocked_on = None
         
         if self.reached:
             current_cell.leaving()
@@ -206,7 +210,7 @@ class Car:
                 print(f"Car {self.car_id} blocked: cell {(y, x)} out of bounds.")
                 break
 
-            next_cell = self.grid[y][x]
+            next_cell = self.grid.cell(y, x)
 
             # Enforce right-side driving at movement time as well
             if not self.is_on_correct_lane(current_y, current_x, y, x):
@@ -219,10 +223,12 @@ class Car:
 
             if next_cell.getCellType() == 3 and not next_cell.getOnOrOff():
                 print(f"Car {self.car_id} blocked at red light at {(y, x)}.")
+                self.blocked_on = ('light', next_cell.cluster)
                 break
 
             if next_cell.isOccupied():
                 print(f"Car {self.car_id} blocked: cell {(y, x)} is occupied.")
+                self.blocked_on = ('cell', (y, x))
                 break
 
             current_cell.leaving()
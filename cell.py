@@ -1,21 +1,67 @@
+from road_index import RoadIndex
+
+
 class Cell:
-    def __init__(self, y, x, cell_type, intersections):
+    def __init__(self, y, x, cell_type, intersections, index=None, cell_id=0):
         self.y = y
         self.x = x
 
         # Determine if the cell is an intersection
         if 0 <= y < intersections.shape[0] and 0 <= x < intersections.shape[1] and intersections[y, x]:
-            self.cell_type = 3
-        else:
-            self.cell_type = cell_type
+            cell_type = 3
+
+        # Per-cell state lives in the road index arrays under this cell's id
+        self.index = index if index is not None else RoadIndex.single(y, x, cell_type)
+        self.id = cell_id
+        self.cell_type = cell_type
 
         # Movement, state, and tracking
         self.canMove = []
-        self.OnOrOff = False  # Traffic light state
-        self.occupied = False  # Includes both cars and red lights at intersections
-        self.occupied_by_car = False
         self.time_spent_log = []
-        self.total_cars_passed = 0
+
+        # Active-set scheduling: the scheduler to notify when the cell frees up
+        self.scheduler = None
+
+    # --- State stored in the road index ---
+    @property
+    def cell_type(self):
+        return int(self.index.cell_type[self.id])
+
+    @cell_type.setter
+    def cell_type(self, value):
+        self.index.cell_type[self.id] = value
+
+    @property
+    def OnOrOff(self):  # Traffic light state
+        return bool(self.index.green[self.id])
+
+    @OnOrOff.setter
+    def OnOrOff(self, value):
+        self.index.green[self.id] = value
+
+    @property
+    def occupied(self):  # Includes both cars and red lights at intersections
+        return bool(self.index.occupied[self.id])
+
+    @occupied.setter
+    def occupied(self, value):
+        self.index.occupied[self.id] = value
+
+    @property
+    def occupied_by_car(self):
+        return bool(self.index.occupied_by_car[self.id])
+
+    @occupied_by_car.setter
+    def occupied_by_car(self, value):
+        self.index.occupied_by_car[self.id] = value
+
+    @property
+    def total_cars_passed(self):
+        return int(self.index.cars_passed[self.id])
+
+    @property
+    def cluster(self):  # Light cluster id, -1 if none
+        return int(self.index.cluster[self.id])
 
     # --- Getters and traffic light control ---
     def getCellType(self):
@@ -30,11 +76,14 @@ class Cell:
     def setOnOrOff(self, switch):
         """Set traffic light state: True = green, False = red."""
         if self.cell_type == 3:
+            flipped = self.OnOrOff != switch
             self.OnOrOff = switch
             if switch and not self.occupied_by_car:
                 self.occupied = False
             elif not switch:
                 self.occupied = True
+            if flipped and self.scheduler is not None:
+                self.scheduler.light_changed(self)
 
     def switch_traffic_light(self):
         """Toggle the traffic light state and update occupancy accordingly."""
@@ -49,6 +98,8 @@ class Cell:
         self.occupied_by_car = False
         if self.cell_type != 3 or self.OnOrOff:  # If not an intersection, or green light
             self.occupied = False
+        if self.scheduler is not None:
+            self.scheduler.cell_vacated(self)
 
     # --- Movement configuration ---
     def addMove(self, move):
@@ -120,7 +171,7 @@ class Cell:
     # --- Car time logging ---
     def addTimeSpent(self, time_spent):
         self.time_spent_log.append(time_spent)
-        self.total_cars_passed += 1
+        self.index.cars_passed[self.id] += 1
 
     def getTimeLog(self):
         return self.time_spent_log
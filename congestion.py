@@ -0,0 +1,125 @@
+import numpy as np
+
+from routing import batch_routes
+
+
+class CongestionMonitor:
+    """Turns observed occupancy and dwell time per road segment into A* costs.
+
+    Every tick the car positions (see fleet.FleetSnapshot) are binned per
+    segment (see City._label_segments). Every `interval` ticks the window is folded into
+    a per-segment cost, broadcast back onto the road cells in one array operation,
+    and cars whose remaining route got more than `threshold` times more
+    expensive than when it was planned are rerouted in one batch_routes call
+    over the lane graph.
+    """
+
+    def __init__(self, city, index, lane_graph, interval=20, threshold=1.5, smoothing=0.5,
+                 max_cost=10.0, processes=None):
+        self.city = city
+        self.index = index
+        self.lane_graph = lane_graph
+        self.processes = processes
+        self.interval = interval
+        self.threshold = threshold
+        self.smoothing = smoothing
+        self.max_cost = max_cost
+
+        # Segment and cost per road index id
+        self.segments = index.segment
+        n = city.num_segments
+        self.segment_length = np.maximum(np.bincount(self.segments[self.segments >= 0], minlength=n), 1)
+        self.segment_cost = np.ones(n)
+        self.cost = np.ones(index.size)
+
+        self.occupancy = np.zeros(n)
+        self.dwell = np.zeros(n)
+        self.ticks = 0
+
+    def observe(self, fleet):
+        """Accumulate one tick of occupancy and dwell (cars that did not move)."""
+        self.ticks += 1
+        live = ~fleet.reached
+        if not live.any():
+            return
+        pos = fleet.positions[live]
+        seg = self.segments[self.index.ids[pos[:, 0], pos[:, 1]]]
+        on_segment = seg >= 0
+        n = len(self.segment_cost)
+
+        self.occupancy += np.bincount(seg[on_segment], minlength=n)
+        stuck = on_segment & fleet.known[live] & (fleet.moved[live] == 0)
+        self.dwell += np.bincount(seg[stuck], minlength=n)
+
+    def update_costs(self):
+        """Fold the current window into segment costs and refresh the per-cell costs."""
+        if self.ticks == 0:
+            return
+        # A car that is stuck a fraction p of its ticks takes ~1/(1-p) ticks per cell
+        stuck_fraction = np.divide(self.dwell, self.occupancy,
+                                   out=np.zeros_like(self.dwell), where=self.occupancy > 0)
+        density = self.occupancy / (self.ticks * self.segment_length)
+        observed = (1.0 + density) / np.maximum(1.0 - stuck_fraction, 1.0 / self.max_cost)
+        observed = np.minimum(observed, self.max_cost)
+
+        self.segment_cost = (1 - self.smoothing) * self.segment_cost + self.smoothing * observed
+        on_segment = self.segments >= 0
+        self.cost[on_segment] = self.segment_cost[self.segments[on_segment]]
+
+        self.occupancy[:] = 0
+        self.dwell[:] = 0
+        self.ticks = 0
+
+    def path_costs(self, car):
+        """Current cost of every cell on the car's path."""
+        if not car.path:
+            return np.zeros(0)
+        ys, xs = np.array(car.path).T
+        return self.cost[self.index.ids[ys, xs]]
+
+    def reroute(self, cars, scheduler=None):
+        """Reroute every car whose remaining route cost grew past the threshold."""
+        stale = []
+        for car in cars:
+            if car.reached or car.path_index >= len(car.path):
+                continue
+            costs = self.path_costs(car)
+            planned = getattr(car, 'planned_costs', None)
+            if planned is None or len(planned) != len(costs):
+                # Path found outside Grid.route_cars or reroute (Car.compute_path)
+                car.planned_costs = costs
+                continue
+            if costs[car.path_index:].sum() > self.threshold * planned[car.path_index:].sum():
+                stale.append(car)
+        if not stale:
+            return 0
+
+        route, route_start = batch_routes(self.lane_graph,
+                                          [c.position for c in stale],
+                                          [c.destination for c in stale],
+                                          cost=self.cost, processes=self.processes)
+        rerouted = 0
+        for k, car in enumerate(stale):
+            # Only used if the car later falls back to Car.compute_path
+            car.edge_cost = self.cost
+            path = route[route_start[k]:route_start[k + 1]]
+            if len(path):
+                # Keep the old route if no new one is found
+                car.path = [tuple(p) for p in path.tolist()]
+                car.path_index = 0
+                rerouted += 1
+                if scheduler is not None:
+                    scheduler.wake_car(car)
+            car.planned_costs = self.path_costs(car)
+        return rerouted
+
+    def refresh(self, tick, cars, scheduler=None):
+        """Update costs and reroute if `tick` ends a window."""
+        if self.interval and tick > 0 and tick % self.interval == 0:
+            self.update_costs()
+            return self.reroute(cars, scheduler)
+        return 0
+
+    def step(self, tick, fleet, cars, scheduler=None):
+        self.observe(fleet)
+        return self.refresh(tick, cars, scheduler)
@@ -0,0 +1,12 @@
+import contextlib
+import os
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silence stdout; Car.update prints on every move."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+# Car states, as stored by the trajectory recorder
+ACTIVE, PARKED, ARRIVED, FINISHED = 0, 1, 2, 3
+
+
+class FleetSnapshot:
+    """Per-tick arrays of car positions, states and movement.
+
+    Grid.update captures the fleet once per tick, with a single pass over
+    the Car objects, and hands the snapshot to every per-tick consumer
+    (congestion statistics, flow metrics, trajectory recording, telemetry).
+    Row k is the k-th car of grid.cars; cars are only ever appended, so a
+    row keeps referring to the same car from tick to tick.
+    """
+
+    def __init__(self):
+        self.positions = np.zeros((0, 2), dtype=np.int32)
+        self.car_ids = np.zeros(0, dtype=np.int64)
+        self.reached = np.zeros(0, dtype=bool)
+        self.state = np.zeros(0, dtype=np.uint8)
+        self.moved = np.zeros(0, dtype=np.int64)   # cells advanced since the last capture
+        self.known = np.zeros(0, dtype=bool)       # False for cars new in this capture
+
+    def __len__(self):
+        return len(self.positions)
+
+    def capture(self, cars):
+        n = len(cars)
+        rows = [(c.position[0], c.position[1], c.car_id, c.reached, c.blocked_on is not None,
+                 c.path_index >= len(c.path) > 0) for c in cars]
+        table = np.array(rows, dtype=np.int64).reshape(n, 6)
+
+        positions = table[:, :2].astype(np.int32)
+        previous = len(self.positions)
+        self.known = np.arange(n) < previous
+        self.moved = np.zeros(n, dtype=np.int64)
+        self.moved[:previous] = np.abs(positions[:previous] - self.positions).sum(axis=1)
+
+        self.positions = positions
+        self.car_ids = table[:, 2]
+        self.reached = table[:, 3].astype(bool)
+        self.state = np.full(n, ACTIVE, dtype=np.uint8)
+        self.state[table[:, 4].astype(bool)] = PARKED
+        self.state[table[:, 5].astype(bool)] = FINISHED
+        self.state[self.reached] = ARRIVED
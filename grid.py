@@ -1,10 +1,14 @@
 import numpy as np
 import numpy.ma as ma
-import matplotlib.pyplot as plt
 
 from roads import City
 from cell import Cell
 from car import Car
+from scheduler import Scheduler
+from congestion import CongestionMonitor
+from routing import LaneGraph, batch_routes
+from road_index import RoadIndex
+from fleet import FleetSnapshot
 
 class Grid:
     def __init__(self, 
@@ -12,9 +16,10 @@ class Grid:
                  height, 
                  road_remove_probability=0.1, 
                  event_chance=0.1, 
-                 cars_prob=0.01):
-
-        self.cells = [[None for _ in range(width)] for _ in range(height)]
+                 cars_prob=0.01,
+                 reroute_interval=0,
+                 reroute_threshold=1.5,
+                 route_processes=None):
 
         self.width = width
         self.height = height
@@ -62,8 +67,8 @@ class Grid:
 
         num_cars = 1
 
-        local_road_coords = [(cell.y, cell.x) for row in self.cells for cell in row
-                     if cell is not None and isinstance(cell, Cell) and cell.getCellType() == 2]
+        local = self.index.cell_type == 2
+        local_road_coords = list(zip(self.index.ys[local].tolist(), self.index.xs[local].tolist()))
 
         if num_cars > 0 and len(local_road_coords) >= 2:
             for cid in range(num_cars):
@@ -72,86 +77,155 @@ class Grid:
                 while dest == start:
                     dest = local_road_coords[np.random.choice(len(local_road_coords))]
 
-                c = Car(cid, start, dest, self.cells)
-                start_cell = self.cells[start[1]][start[0]]
-                if start_cell is not None:
-                    start_cell.car_enters()
-                else:
-                    print(f"Warning: Start cell at {start} is None.")
-
-                c.compute_path() 
-                c.trace_path()
+                # Car marks its own start cell (y, x) as occupied
+                c = Car(cid, start, dest, self)
                 self.cars.append(c)
 
+        # Route the whole spawn wave in one batch over the compiled lane graph
+        self.lane_graph = LaneGraph(self.city, self.index)
 
-    def roadsToGrid(self):
-        for y in range(self.height):
-            for x in range(self.width):
-                value = self.city.grid[y, x]
+        # Congestion-aware rerouting, off unless an interval is given
+        self.congestion = None
+        if reroute_interval > 0:
+            self.congestion = CongestionMonitor(self.city, self.index, self.lane_graph,
+                                                interval=reroute_interval,
+                                                threshold=reroute_threshold,
+                                                processes=route_processes)
+
+        self.route_cars(self.cars, processes=route_processes)
+
+        self.scheduler = Scheduler(self.road_cells)
+        for c in self.cars:
+            self.scheduler.add(c)
 
-                if value is None:
-                    continue  # Not a valid road or intersection
+        # Per-phase timing, see profiler.TickProfiler
+        self.profiler = None
 
-                if self.city.intersections[y, x]:
-                    cell_type = 3
-                elif value in(2,4,6):
-                    cell_type = value
-                else:
-                    cell_type = -1
+        # Car positions, states and movement captured once per tick for the
+        # consumers below, so they do not each walk the fleet
+        self.fleet = FleetSnapshot()
 
-                c = Cell(y, x, cell_type,self.city.intersections)
-                c.addPossibleMoves(self.city,
-                                   self.city.intersections,
-                                   self.city.horizontal_roads,
-                                   self.city.vertical_roads)
+        # Per-tick trajectory output, see trajectory.TrajectoryRecorder
+        self.recorder = None
 
-                if self.city.light_A[y,x]:
-                    c.OnOrOff = True
-                else:
-                    c.OnOrOff = False
+        # Flow / density / speed time series, see metrics.FlowMetrics
+        self.metrics = None
 
-                c.occupied_by_car= False
-                c.occupied = False
+        # Live deltas for local clients, see telemetry.TelemetryServer
+        self.telemetry = None
 
-                self.cells[y][x] = c
-                    
+
+    def route_cars(self, cars, processes=None):
+        if not cars:
+            return
+        route, route_start = batch_routes(self.lane_graph,
+                                          [c.position for c in cars],
+                                          [c.destination for c in cars],
+                                          processes=processes)
+        for k, c in enumerate(cars):
+            c.path = [tuple(p) for p in route[route_start[k]:route_start[k + 1]].tolist()]
+            c.path_index = 0
+            if self.congestion is not None:
+                # Baseline for CongestionMonitor.reroute, all ones at spawn
+                c.planned_costs = self.congestion.path_costs(c)
+
+    def roadsToGrid(self):
+        # Cells exist for road and intersection cells only, one per road index id
+        self.index = RoadIndex(self.city)
+        self.road_cells = []
+        for cell_id, (y, x) in enumerate(zip(self.index.ys.tolist(), self.index.xs.tolist())):
+            c = Cell(y, x, int(self.index.cell_type[cell_id]), self.city.intersections,
+                     self.index, cell_id)
+            c.addPossibleMoves(self.city,
+                               self.city.intersections,
+                               self.city.horizontal_roads,
+                               self.city.vertical_roads)
+
+            self.road_cells.append(c)
+
+    def cell(self, y, x):
+        """Cell at (y, x), or None off the road network."""
+        cell_id = self.index.ids[y, x]
+        return self.road_cells[cell_id] if cell_id >= 0 else None
 
     def add_Random_events(self, event_chance=0.1):
-        for row in self.cells:
-            for c in row:
-                if c and c.cell_type == 2 and np.random.rand() < event_chance:
-                    c.cell_type = -1
-                    self.city.grid[c.y, c.x] = -1
+        for c in self.road_cells:
+            if c.cell_type == 2 and np.random.rand() < event_chance:
+                c.cell_type = -1
+                self.city.grid[c.y, c.x] = -1
 
     def update(self, switch=False):
-        
-        self.switch_traffic_light()
-        # for c in self.cars:
-        #     if c.cell_type == 2:
-        #         c.update()
+        prof = self.profiler if self.profiler is not None and self.profiler.enabled else None
+        if prof:
+            prof.begin_tick()
+
+        if switch:
+            self.switch_traffic_light()
+        if prof:
+            prof.lap('signals')
+
+        # Only cars that are not parked behind a light or another car
+        self.scheduler.step()
+        if prof:
+            prof.lap('movement')
+
+        if (self.recorder is not None or self.metrics is not None or
+                self.telemetry is not None or self.congestion is not None):
+            self.fleet.capture(self.cars)
+            if prof:
+                prof.lap('statistics')
+
+        if self.recorder is not None:
+            self.recorder.record(self.scheduler.tick - 1, self.fleet, self.index)
+            if prof:
+                prof.lap('statistics')
+
+        if self.metrics is not None:
+            self.metrics.observe(self.scheduler.tick - 1, self.fleet)
+            if prof:
+                prof.lap('statistics')
+
+        if self.telemetry is not None:
+            self.telemetry.publish(self.scheduler.tick - 1, self.fleet)
+            if prof:
+                prof.lap('rendering')
+
+        if self.congestion is not None:
+            self.congestion.observe(self.fleet)
+            if prof:
+                prof.lap('statistics')
+            self.congestion.refresh(self.scheduler.tick, self.cars, self.scheduler)
+            if prof:
+                prof.lap('routing')
+
+        if prof:
+            prof.end_tick()
 
     def switch_traffic_light(self):
-        mask = np.ma.mask_or(self.city.light_A, self.city.light_B)
-        for y, x in zip(*np.where(mask)):
-            cell = self.cells[y][x]
-            if cell:
-                cell.switch_traffic_light()
+        flipped = self.index.switch_lights()
+        self.scheduler.lights_changed(self.index.cluster[flipped])
 
-    def plot(self):
+    def _road_image(self, occupancy=False):
         img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
+        idx = self.index
+        colors = np.full((idx.size, 3), 255, dtype=np.uint8)
+        if occupancy:
+            colors[idx.cell_type != -1] = [169, 169, 169]
+            colors[(idx.cell_type != -1) & idx.occupied] = [255, 0, 0]
+        else:
+            colors[idx.cell_type == 2] = [200, 200, 200]
+            colors[idx.cell_type == 4] = [100, 100, 100]
+            colors[idx.cell_type == 6] = [0, 0, 0]
+            lights = idx.cell_type == 3
+            colors[lights & idx.green] = [0, 255, 0]
+            colors[lights & ~idx.green] = [255, 0, 0]
+        img[idx.ys, idx.xs] = colors
+        return img
+
+    def plot(self):
+        import matplotlib.pyplot as plt
 
-        for y in range(self.height):
-            for x in range(self.width):
-                cell = self.cells[y][x]
-                if cell:
-                    if cell.cell_type == 2:
-                        img[y, x] = [200, 200, 200]
-                    elif cell.cell_type == 4:
-                        img[y, x] = [100, 100, 100]
-                    elif cell.cell_type == 6:
-                        img[y, x] = [0, 0, 0]
-                    elif cell.cell_type == 3:
-                        img[y, x] = [0, 255, 0] if cell.getOnOrOff() else [255, 0, 0]
+        img = self._road_image()
 
         plt.figure(figsize=(10, 10))
         plt.imshow(img, origin='upper')
@@ -160,20 +234,9 @@ class Grid:
         plt.show()
 
     def plot_cars(self):
-        img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
+        import matplotlib.pyplot as plt
 
-        for y in range(self.height):
-            for x in range(self.width):
-                cell = self.cells[y][x]
-                if cell:
-                    if cell.cell_type == 2:
-                        img[y, x] = [200, 200, 200]
-                    elif cell.cell_type == 4:
-                        img[y, x] = [100, 100, 100]
-                    elif cell.cell_type == 6:
-                        img[y, x] = [0, 0, 0]
-                    elif cell.cell_type == 3:
-                        img[y, x] = [0, 255, 0] if cell.getOnOrOff() else [255, 0, 0]
+        img = self._road_image()
 
         for car in self.cars:
             if not car.path:
@@ -195,34 +258,12 @@ class Grid:
         plt.show()
 
     def get_image(self):
-        img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
-
-        for y in range(self.height):
-            for x in range(self.width):
-                cell = self.cells[y][x]
-                if cell:
-                    if cell.cell_type == 2:
-                        img[y, x] = [200, 200, 200]
-                    elif cell.cell_type == 4:
-                        img[y, x] = [100, 100, 100]
-                    elif cell.cell_type == 6:
-                        img[y, x] = [0, 0, 0]
-                    elif cell.cell_type == 3:
-                        img[y, x] = [0, 255, 0] if cell.getOnOrOff() else [255, 0, 0]
-        return img
+        return self._road_image()
 
     def plot_occupied(self):
-        img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
+        import matplotlib.pyplot as plt
 
-        for y in range(self.height):
-            for x in range(self.width):
-                cell = self.cells[y][x]
-                if cell:
-                    if cell.cell_type in (2, 3, 4, 6):
-                        if cell.occupied:
-                            img[y, x] = [255, 0, 0]
-                        else:
-                            img[y, x] = [169, 169, 169]
+        img = self._road_image(occupancy=True)
 
         plt.figure(figsize=(10, 10))
         plt.imshow(img, origin='upper')
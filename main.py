@@ -1,37 +1,139 @@
-from roads import City
+"""Run a headless simulation from a JSON config file.
+
+    python main.py run.json
+    python main.py run.json --set time=500 width=400 --output result.json
+
+The config holds Model arguments plus a few run options, e.g.
+
+    {
+        "width": 200, "height": 200, "time": 100,
+        "profile": true, "metrics": "out/metrics", "metrics_every": 10,
+        "seed": 0, "cars": 200, "mode": "serial"
+    }
+
+mode is "serial" (Grid.update every tick), "tiled" (one process per tile,
+"tiles": [2, 2]) or "replicas" ("replicas": K batched seeds with "cars"
+each). "plot": true shows the live animation instead of running headless;
+it is the only option that imports matplotlib. A JSON summary of the run
+goes to --output (stdout by default).
+"""
+import argparse
+import json
+import random
+import sys
 import time
 
-def main():
-    # Configuration
-    width = 200
-    height = 200
-    block_density = (10, 30)
-    base_road_width = 2
-    wide_road_width = 4
-    highway_width = 6
-    road_remove_probability = 0.2
-
-    start = time.time()
-    # Create city instance
-    city = City(
-        width=width,
-        height=height,
-        block_size_range=block_density,
-        base_road_width=base_road_width,
-        wide_road_width=wide_road_width,
-        highway_width=highway_width,
-        road_remove=road_remove_probability
-    )
-    time.sleep(1)
-    end = time.time()
-
-    print(f"Total runtime of the program is {end - start} seconds")
-    # Generate roads and plot the result
-    city.generateRoads()
-    city.plot_city_grid()
-    city.animate_traffic(10,1)
-
-    
+import numpy as np
+
+from model import Model
+from car import Car
+from console import quiet
+
+
+# Keys handled here; everything else is passed to Model
+RUN_KEYS = ('mode', 'seed', 'cars', 'tiles', 'replicas', 'seeds', 'plot', 'verbose')
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def load_config(path, overrides=()):
+    with open(path) as f:
+        config = json.load(f)
+    for item in overrides:
+        key, _, value = item.partition('=')
+        config[key] = _parse_value(value)
+    return config
+
+
+def spawn_cars(grid, cars, rng, processes=None):
+    """Add up to `cars` cars between random local road cells, routed in one batch."""
+    local = np.flatnonzero(grid.index.cell_type == 2)
+    if len(local) < 2:
+        return
+    new = []
+    for s, d in rng.choice(local, (cars, 2)):
+        start = (int(grid.index.ys[s]), int(grid.index.xs[s]))
+        dest = (int(grid.index.ys[d]), int(grid.index.xs[d]))
+        if s == d or grid.cell(*start).isOccupied():
+            continue
+        new.append(Car(len(grid.cars) + len(new), start, dest, grid))
+    grid.route_cars(new, processes=processes)
+    for car in new:
+        grid.cars.append(car)
+        grid.scheduler.add(car)
+
+
+def run(config):
+    options = {k: config[k] for k in RUN_KEYS if k in config}
+    model = Model(**{k: v for k, v in config.items() if k not in RUN_KEYS})
+    mode = options.get('mode', 'serial')
+    seed = options.get('seed', 0)
+    random.seed(seed)
+    np.random.seed(seed)
+
+    summary = {'config': config}
+    with quiet(not options.get('verbose', False)):
+        start = time.perf_counter()
+        model.make_grid()
+        if mode != 'replicas':
+            # Replicas spawn their own fleets from the same "cars" count
+            spawn_cars(model.grid, options.get('cars', 0), np.random.default_rng(seed),
+                       processes=model.route_processes)
+        summary['setup_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if options.get('plot', False):
+            model.simulate_w_plot()
+        elif mode == 'serial':
+            model.simulate()
+        elif mode == 'tiled':
+            model.simulate_tiled(tuple(options.get('tiles', (2, 2))), seed=seed)
+        elif mode == 'replicas':
+            engine = model.simulate_replicas(options.get('replicas', 4), options.get('cars', 100),
+                                             seeds=options.get('seeds'))
+        else:
+            raise ValueError(f"Unknown mode {mode!r}")
+        summary['run_seconds'] = time.perf_counter() - start
+
+    summary['ticks'] = model.time
+    if mode == 'replicas' and not options.get('plot', False):
+        # Totals over the replica fleets; the Grid's own cars take no part
+        arrived = engine.arrived()
+        summary['cars'] = engine.replicas * engine.cars
+        summary['arrived'] = int(arrived.sum())
+        summary['arrived_per_replica'] = arrived.tolist()
+    else:
+        cars = model.grid.cars
+        summary['cars'] = len(cars)
+        summary['arrived'] = sum(c.reached for c in cars)
+    # Only Grid.update is profiled; tiled and replica runs record no ticks
+    if model.profiler.enabled and model.profiler.ticks > 0:
+        summary['profile'] = model.profiler.summary()
+    model.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a headless traffic simulation from a config file.")
+    parser.add_argument('config', help="JSON file with Model arguments and run options")
+    parser.add_argument('--set', nargs='+', default=[], metavar='KEY=VALUE',
+                        help="override config entries, values parsed as JSON")
+    parser.add_argument('--output', default='-', help="JSON summary file, '-' for stdout")
+    args = parser.parse_args(argv)
+
+    summary = run(load_config(args.config, args.set))
+    if args.output == '-':
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+import json
+import os
+import numpy as np
+
+
+CLASSES = (2, 4, 6)
+METRICS = ('density', 'flow', 'speed')
+
+
+class FlowMetrics:
+    """Density, flow and speed per road segment and per road class.
+
+    Every tick the live cars are binned per segment (see
+    City._label_segments) with np.bincount, once for the car count and once
+    weighted by the cells each car advanced since the previous tick. Every
+    `every` ticks the window is averaged into one sample:
+
+        density  cars per cell
+        speed    cells per tick, averaged over the cars present
+        flow     cars per tick passing a point, density * speed
+
+    Per-class values weigh every segment by its length, so they are the same
+    quantities over all cells of that class. With a path, samples are
+    appended to segments.bin (float32, [metric, segment]) and classes.bin
+    (float32, [metric, class]) with their ticks in ticks.bin; load_metrics
+    maps them back as arrays.
+    """
+
+    def __init__(self, city, index, path=None, every=1):
+        self.index = index
+        self.every = every
+        self.path = path
+
+        self.segments = index.segment
+        n = city.num_segments
+        on_segment = self.segments >= 0
+        self.segment_length = np.bincount(self.segments[on_segment], minlength=n)
+        self.segment_class = np.zeros(n, dtype=np.int8)
+        self.segment_class[self.segments[on_segment]] = index.cell_type[on_segment]
+        # Segment -> position in CLASSES, -1 for anything else
+        self.class_of = np.searchsorted(CLASSES, self.segment_class)
+        self.class_of[~np.isin(self.segment_class, CLASSES)] = -1
+        self.class_length = self._per_class(self.segment_length)
+
+        self.cars = np.zeros(n)
+        self.moves = np.zeros(n)
+        self.ticks = 0
+
+        # Latest sample
+        self.tick = -1
+        self.segment = np.zeros((len(METRICS), n), dtype=np.float32)
+        self.by_class = np.zeros((len(METRICS), len(CLASSES)), dtype=np.float32)
+
+        self._files = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'segment_class.npy'), self.segment_class)
+            np.save(os.path.join(path, 'segment_length.npy'), self.segment_length)
+            with open(os.path.join(path, 'metrics.json'), 'w') as f:
+                json.dump({'segments': n, 'classes': CLASSES, 'metrics': METRICS, 'every': every}, f)
+            self._files = {name: open(os.path.join(path, name + '.bin'), 'wb')
+                           for name in ('segments', 'classes', 'ticks')}
+
+    def _per_class(self, values):
+        known = self.class_of >= 0
+        return np.bincount(self.class_of[known], weights=values[known], minlength=len(CLASSES))
+
+    def observe(self, tick, fleet):
+        """Accumulate one tick of a FleetSnapshot; closes a sample every `every` ticks."""
+        self.ticks += 1
+        live = ~fleet.reached
+        if live.any():
+            pos = fleet.positions[live]
+            seg = self.segments[self.index.ids[pos[:, 0], pos[:, 1]]]
+            on_segment = seg >= 0
+            n = len(self.cars)
+            self.cars += np.bincount(seg[on_segment], minlength=n)
+            self.moves += np.bincount(seg[on_segment], weights=fleet.moved[live][on_segment], minlength=n)
+
+        if self.ticks >= self.every:
+            self._sample(tick)
+
+    def _sample(self, tick):
+        for out, cars, moves, length in ((self.segment, self.cars, self.moves, self.segment_length),
+                                         (self.by_class, self._per_class(self.cars),
+                                          self._per_class(self.moves), self.class_length)):
+            cells = np.maximum(length * self.ticks, 1)
+            out[0] = cars / cells
+            out[1] = moves / cells
+            out[2] = np.divide(moves, cars, out=np.zeros_like(moves), where=cars > 0)
+
+        self.tick = tick
+        if self._files is not None:
+            self._files['segments'].write(self.segment.tobytes())
+            self._files['classes'].write(self.by_class.tobytes())
+            self._files['ticks'].write(np.int64(tick).tobytes())
+
+        self.cars[:] = 0
+        self.moves[:] = 0
+        self.ticks = 0
+
+    def flush(self):
+        if self._files is not None:
+            for f in self._files.values():
+                f.flush()
+
+    def close(self):
+        if self._files is not None:
+            for f in self._files.values():
+                f.close()
+            self._files = None
+
+
+def load_metrics(path):
+    """Memory-map a FlowMetrics recording.
+
+    Returns ticks (T,), segments (T, 3, S) and classes (T, 3, 3), with the
+    metric axis ordered as METRICS and the class axis as CLASSES, plus the
+    per-segment class and length.
+    """
+    with open(os.path.join(path, 'metrics.json')) as f:
+        meta = json.load(f)
+    ticks = np.fromfile(os.path.join(path, 'ticks.bin'), dtype=np.int64)
+    count = len(ticks)
+
+    def series(name, width):
+        if count == 0:
+            return np.zeros((0, len(METRICS), width), dtype=np.float32)
+        return np.memmap(os.path.join(path, name + '.bin'), dtype=np.float32, mode='r',
+                         shape=(count, len(METRICS), width))
+
+    return {
+        'ticks': ticks,
+        'segments': series('segments', meta['segments']),
+        'classes': series('classes', len(CLASSES)),
+        'segment_class': np.load(os.path.join(path, 'segment_class.npy')),
+        'segment_length': np.load(os.path.join(path, 'segment_length.npy')),
+        'every': meta['every'],
+    }
@@ -1,7 +1,12 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from time import perf_counter
 import grid as grid_module
+from profiler import TickProfiler
+import parallel
+from replicas import ReplicaEngine
+from trajectory import TrajectoryRecorder
+from metrics import FlowMetrics
+from telemetry import TelemetryServer
 
 class Model:
     def __init__(self, 
@@ -11,10 +16,17 @@ class Model:
                  cars_prob=0.0, 
                  road_remove_probability=0.1,
                  event_chance=0.1,
-                 traffic_light_time= 2,
                  current_time_step = 0,
                  traffic_light_time=10,
-                 move_chance=0.9):
+                 move_chance=0.9,
+                 reroute_interval=0,
+                 reroute_threshold=1.5,
+                 route_processes=None,
+                 profile=False,
+                 record=None,
+                 metrics=None,
+                 metrics_every=1,
+                 telemetry_port=None):
         
         self.width = width
         self.height = height
@@ -24,6 +36,18 @@ class Model:
         self.move_chance = move_chance
         self.road_remove_probability = road_remove_probability
         self.event_chance = event_chance
+        self.reroute_interval = reroute_interval
+        self.reroute_threshold = reroute_threshold
+        self.route_processes = route_processes
+        self.record = record  # Directory for a trajectory recording, None to skip
+        self.metrics = metrics  # Directory for flow metrics, None to skip
+        self.metrics_every = metrics_every
+        self.telemetry_port = telemetry_port  # Serve live deltas on localhost, None to skip
+
+        # Switch at runtime with self.profiler.enable() / disable()
+        self.profiler = TickProfiler(capacity=max(time, 1))
+        if profile:
+            self.profiler.enable()
 
     def make_grid(self):
         self.grid = grid_module.Grid(
@@ -31,14 +55,49 @@ class Model:
             height=self.height,
             road_remove_probability=self.road_remove_probability,
             event_chance=self.event_chance,
-            cars_prob=self.cars_prob
+            cars_prob=self.cars_prob,
+            reroute_interval=self.reroute_interval,
+            reroute_threshold=self.reroute_threshold,
+            route_processes=self.route_processes
         )
+        self.grid.profiler = self.profiler
+        if self.record is not None:
+            self.grid.recorder = TrajectoryRecorder(self.record, self.grid)
+        if self.metrics is not None:
+            self.grid.metrics = FlowMetrics(self.grid.city, self.grid.index,
+                                            path=self.metrics, every=self.metrics_every)
+        if self.telemetry_port is not None:
+            self.grid.telemetry = TelemetryServer(self.grid, port=self.telemetry_port).start()
 
     def simulate(self):
         for i in range(self.time):
             self.grid.update(i % self.traffic_light_time == 0)
+        self.grid.scheduler.settle()
+        if self.grid.recorder is not None:
+            self.grid.recorder.flush()
+        if self.grid.metrics is not None:
+            self.grid.metrics.flush()
+
+    def simulate_tiled(self, tiles=(2, 2), seed=0):
+        # One worker process per tile, see parallel.simulate_tiled
+        return parallel.simulate_tiled(self.grid, self.time, tiles,
+                                       traffic_light_time=self.traffic_light_time,
+                                       move_probability=self.move_chance,
+                                       seed=seed)
+
+    def simulate_replicas(self, replicas, cars, seeds=None):
+        # K replicas of this model's city stepped together, see ReplicaEngine
+        engine = ReplicaEngine(self.grid.city, replicas, cars, seeds=seeds,
+                               traffic_light_time=self.traffic_light_time,
+                               move_probability=self.move_chance,
+                               route_processes=self.route_processes)
+        engine.run(self.time)
+        return engine
 
     def simulate_w_plot(self):
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
         fig, ax = plt.subplots(figsize=(8, 8))
         img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
         im = ax.imshow(img, animated=True)
@@ -47,12 +106,29 @@ class Model:
 
         def update_plot(frame):
             self.grid.update(frame % self.traffic_light_time == 0)
+            start = perf_counter()
             new_img = self.grid.get_image()
+            if self.profiler.enabled:
+                self.profiler.add('rendering', perf_counter() - start)
             im.set_array(new_img)
             return [im]
 
         ani = animation.FuncAnimation(fig, update_plot, frames=self.time, interval=100, blit=True)
         plt.show()
+        self.grid.scheduler.settle()
+        if self.grid.recorder is not None:
+            self.grid.recorder.flush()
+        if self.grid.metrics is not None:
+            self.grid.metrics.flush()
+
+    def close(self):
+        """Close the recording and metrics files and stop the telemetry server."""
+        if self.grid.recorder is not None:
+            self.grid.recorder.close()
+        if self.grid.metrics is not None:
+            self.grid.metrics.close()
+        if self.grid.telemetry is not None:
+            self.grid.telemetry.stop()
 
 if __name__ == "__main__":
     sim = Model()
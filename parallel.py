@@ -0,0 +1,359 @@
+import numpy as np
+import multiprocessing as mp
+import threading
+from multiprocessing import shared_memory
+
+from scheduler import Scheduler
+
+
+# ---------------------------------------------------------------------------
+# Partitioning
+# ---------------------------------------------------------------------------
+
+def _cuts(free, n):
+    """Pick n-1 cut positions among the `free` lines, as close as possible to an even split."""
+    length = len(free)
+    candidates = np.flatnonzero(free)
+    cuts = [0]
+    for k in range(1, n):
+        ideal = k * length / n
+        ok = candidates[candidates > cuts[-1]]
+        if len(ok) == 0:
+            break
+        cut = int(ok[np.argmin(np.abs(ok - ideal))])
+        if cut >= length:
+            break
+        cuts.append(cut)
+    cuts.append(length)
+    return cuts
+
+
+def partition(city, tiles_y, tiles_x):
+    """Split the city into rectangular tiles whose edges run through block interiors.
+
+    Cuts are only placed on rows (columns) that no horizontal (vertical) road
+    crosses, so a lane is never split along its length. The result depends
+    only on the map and the requested tile counts.
+    """
+    row_cuts = _cuts(~city.horizontal_roads.any(axis=1), tiles_y)
+    col_cuts = _cuts(~city.vertical_roads.any(axis=0), tiles_x)
+
+    tiles = []
+    for y0, y1 in zip(row_cuts[:-1], row_cuts[1:]):
+        for x0, x1 in zip(col_cuts[:-1], col_cuts[1:]):
+            tiles.append((y0, y1, x0, x1))
+    return tiles, row_cuts, col_cuts
+
+
+# ---------------------------------------------------------------------------
+# Shared memory helpers
+# ---------------------------------------------------------------------------
+
+def _share(blocks, specs, name, array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    blocks.append(shm)
+    specs[name] = (shm.name, array.shape, array.dtype.str)
+    return view
+
+
+def _attach(specs):
+    blocks, arrays = [], {}
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return blocks, arrays
+
+
+def _uniform(seed, tick, car_ids, steps):
+    """Counter-based uniforms per (car, step): independent of tiling and update order."""
+    with np.errstate(over='ignore'):
+        return _mix(car_ids, seed, tick, steps)
+
+
+def _mix(car_ids, seed, tick, steps):
+    x = (car_ids.astype(np.uint64)[:, None] * np.uint64(0x9E3779B97F4A7C15)
+         + np.arange(steps, dtype=np.uint64)[None, :] * np.uint64(0xBF58476D1CE4E5B9)
+         + np.uint64(tick) * np.uint64(0x94D049BB133111EB)
+         + np.uint64(seed))
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+# ---------------------------------------------------------------------------
+# Tile worker
+# ---------------------------------------------------------------------------
+
+def _run_tile(tile_id, specs, config, barrier):
+    blocks, a = _attach(specs)
+    try:
+        _tile_loop(tile_id, a, config, barrier)
+    except BaseException:
+        # Release the other tiles instead of leaving them at the barrier
+        barrier.abort()
+        raise
+    finally:
+        a.clear()
+        for shm in blocks:
+            shm.close()
+
+
+def _tile_loop(tile_id, a, config, barrier):
+    y0, y1, x0, x1 = config['tiles'][tile_id]
+    n_tiles = len(config['tiles'])
+    light_time = config['traffic_light_time']
+    move_probability = config['move_probability']
+    seed = config['seed']
+
+    cell_type, light_A = a['cell_type'], a['light_A']
+    row_tile, col_tile, n_cols = a['row_tile'], a['col_tile'], config['tiles_x']
+    occupancy, published = a['occupancy'], a['published']
+    route, route_start, speed = a['route'], a['route_start'], a['speed']
+    pos, path_index, owner = a['position'], a['path_index'], a['owner']
+    done, time_spent = a['done'], a['time_spent']
+    mailbox, mail_count = a['mailbox'], a['mail_count']
+
+    local = sorted(np.flatnonzero((owner == tile_id) & ~done).tolist())
+    pending = {}  # car -> origin cell of a handoff waiting for the neighbour's answer
+    max_speed = int(speed.max()) if len(speed) else 1
+
+    def tile_of(y, x):
+        return row_tile[y] * n_cols + col_tile[x]
+
+    def publish():
+        # Halo ring: the only own cells a neighbour can try to drive into
+        published[y0, x0:x1] = occupancy[y0, x0:x1]
+        published[y1 - 1, x0:x1] = occupancy[y1 - 1, x0:x1]
+        published[y0:y1, x0] = occupancy[y0:y1, x0]
+        published[y0:y1, x1 - 1] = occupancy[y0:y1, x1 - 1]
+
+    try:
+        publish()
+        barrier.wait()
+
+        for tick in range(config['ticks']):
+            # Same switching rule as Model.simulate: a switch at every multiple of light_time
+            a_green = (tick // light_time + 1) % 2 == 0
+            send, recv = tick % 2, (tick - 1) % 2
+            mail_count[send, tile_id, :] = 0
+
+            # --- Phase 1: accept arrivals, then move own cars (writes own cells only)
+            arrived = set()
+            if tick > 0:
+                for src in range(n_tiles):
+                    for k in range(mail_count[recv, src, tile_id]):
+                        car = int(mailbox[recv, src, tile_id, k])
+                        y, x = route[path_index[car]]
+                        if occupancy[y, x]:
+                            continue
+                        if cell_type[y, x] == 3 and light_A[y, x] != a_green:
+                            continue
+                        owner[car] = tile_id
+                        pos[car] = (y, x)
+                        path_index[car] += 1
+                        if path_index[car] >= route_start[car + 1]:
+                            done[car] = True
+                        else:
+                            occupancy[y, x] = 1
+                            arrived.add(car)
+                if arrived:
+                    local = sorted(local + list(arrived))
+
+            for car in pending:
+                time_spent[car] += 1
+
+            moving = [c for c in local if c not in pending and c not in arrived]
+            draws = _uniform(seed, tick, np.array(moving, dtype=np.int64), max_speed) if moving else None
+            finished = set()
+            for n, car in enumerate(moving):
+                cy, cx = pos[car]
+                end = route_start[car + 1]
+                for step in range(speed[car]):
+                    i = path_index[car]
+                    if i >= end:
+                        break
+                    if draws[n, step] > move_probability:
+                        break
+                    y, x = route[i]
+                    if not (y0 <= y < y1 and x0 <= x < x1):
+                        # Boundary car: hand it to the neighbour if its halo shows room
+                        if not published[y, x]:
+                            dst = tile_of(y, x)
+                            mailbox[send, tile_id, dst, mail_count[send, tile_id, dst]] = car
+                            mail_count[send, tile_id, dst] += 1
+                            pending[car] = (cy, cx, tick)
+                        break
+                    if cell_type[y, x] == 3 and light_A[y, x] != a_green:
+                        break
+                    if occupancy[y, x]:
+                        break
+                    occupancy[cy, cx] = 0
+                    occupancy[y, x] = 1
+                    path_index[car] = i + 1
+                    pos[car] = (y, x)
+                    cy, cx = y, x
+                time_spent[car] += 1
+                if path_index[car] >= end:
+                    occupancy[cy, cx] = 0
+                    done[car] = True
+                    finished.add(car)
+
+            barrier.wait()
+
+            # --- Phase 2: settle last tick's handoffs, publish the halo ring
+            for car, (oy, ox, sent) in list(pending.items()):
+                if sent == tick:
+                    continue  # the neighbour answers next tick
+                del pending[car]
+                if owner[car] != tile_id:
+                    occupancy[oy, ox] = 0
+                    finished.add(car)
+            if finished:
+                local = [c for c in local if c not in finished]
+            publish()
+
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        # Another tile failed and aborted the barrier; the driver reports it
+        return
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def simulate_tiled(grid, ticks, tiles=(2, 2), traffic_light_time=10,
+                   move_probability=0.9, seed=0):
+    """Run `ticks` steps of `grid` with one worker process per tile.
+
+    Map layers, occupancy, routes and car state live in shared memory. Each
+    worker only writes cells and cars it owns; cars crossing a tile edge are
+    handed over through per-tile mailboxes and accepted by the neighbour on
+    the next tick, using the published halo ring to avoid doomed requests.
+    Random draws are keyed on (seed, tick, car), so a run is reproducible
+    for a given map, fleet, seed and tile layout.
+
+    Cars and cells of `grid` are updated in place when the run finishes.
+    """
+    city = grid.city
+    tile_list, row_cuts, col_cuts = partition(city, *tiles)
+    tiles_x = len(col_cuts) - 1
+    n_tiles = len(tile_list)
+    height, width = city.height, city.width
+
+    row_tile = (np.searchsorted(row_cuts, np.arange(height), side='right') - 1).astype(np.int32)
+    col_tile = (np.searchsorted(col_cuts, np.arange(width), side='right') - 1).astype(np.int32)
+
+    cell_type = city.grid.astype(np.int8)
+    cell_type[city.intersections] = 3
+
+    cars = grid.cars
+    lengths = np.array([len(c.path) for c in cars], dtype=np.int64)
+    route_start = np.zeros(len(cars) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=route_start[1:])
+    route = np.array([p for c in cars for p in c.path], dtype=np.int32).reshape(-1, 2)
+    position = np.array([c.position for c in cars], dtype=np.int32).reshape(-1, 2)
+    path_index = route_start[:-1] + np.array([c.path_index for c in cars], dtype=np.int64)
+    done = np.array([c.reached or c.path_index >= len(c.path) for c in cars], dtype=bool)
+    speed = np.array([max(int(c.speed), 1) for c in cars], dtype=np.int8)
+    owner = (row_tile[position[:, 0]] * tiles_x + col_tile[position[:, 1]]).astype(np.int32)
+
+    occupancy = np.zeros((height, width), dtype=np.uint8)
+    occupancy[position[~done, 0], position[~done, 1]] = 1
+
+    capacity = max(2 * ((y1 - y0) + (x1 - x0)) for y0, y1, x0, x1 in tile_list)
+
+    blocks, specs = [], {}
+    try:
+        shared = {}
+        for name, array in (('cell_type', cell_type),
+                            ('light_A', city.light_A),
+                            ('row_tile', row_tile),
+                            ('col_tile', col_tile),
+                            ('occupancy', occupancy),
+                            ('published', occupancy),
+                            ('route', route),
+                            ('route_start', route_start),
+                            ('speed', speed),
+                            ('position', position),
+                            ('path_index', path_index),
+                            ('owner', owner),
+                            ('done', done),
+                            ('time_spent', np.zeros(len(cars), dtype=np.int64)),
+                            ('mailbox', np.zeros((2, n_tiles, n_tiles, capacity), dtype=np.int64)),
+                            ('mail_count', np.zeros((2, n_tiles, n_tiles), dtype=np.int64))):
+            shared[name] = _share(blocks, specs, name, array)
+
+        config = {
+            'tiles': tile_list,
+            'tiles_x': tiles_x,
+            'ticks': ticks,
+            'traffic_light_time': traffic_light_time,
+            'move_probability': move_probability,
+            'seed': seed,
+        }
+
+        ctx = mp.get_context()
+        barrier = ctx.Barrier(n_tiles)
+        if n_tiles == 1:
+            _tile_loop(0, shared, config, barrier)
+        else:
+            workers = [ctx.Process(target=_run_tile, args=(t, specs, config, barrier))
+                       for t in range(n_tiles)]
+            for w in workers:
+                w.start()
+            while any(w.is_alive() for w in workers):
+                for w in workers:
+                    w.join(timeout=0.1)
+                if any(w.exitcode not in (None, 0) for w in workers):
+                    # A worker that died without aborting (e.g. killed) still frees the rest
+                    barrier.abort()
+            failed = [w.exitcode for w in workers if w.exitcode != 0]
+            if failed:
+                raise RuntimeError(f"Tile worker failed with exit code {failed[0]}")
+
+        result = {name: shared[name].copy()
+                  for name in ('position', 'done', 'time_spent', 'owner')}
+        result['path_index'] = shared['path_index'] - route_start[:-1]
+        result['tiles'] = tile_list
+        shared.clear()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    _write_back(grid, result, ticks, traffic_light_time)
+    return result
+
+
+def _write_back(grid, result, ticks, traffic_light_time):
+    # The scheduler is replaced below; keep the ticks its parked cars waited
+    grid.scheduler.settle()
+    for car in grid.cars:
+        y, x = car.position
+        grid.cell(y, x).leaving()
+    for car, (y, x), idx, finished, spent in zip(grid.cars, result['position'], result['path_index'],
+                                                 result['done'], result['time_spent']):
+        car.position = (int(y), int(x))
+        car.path_index = int(idx)
+        car.time_spent += int(spent)
+        car.reached = car.position == car.destination
+        if not finished:
+            grid.cell(y, x).car_enters()
+
+    # Lights switched at every multiple of traffic_light_time during the run
+    if ticks > 0 and ((ticks - 1) // traffic_light_time + 1) % 2 == 1:
+        grid.switch_traffic_light()
+
+    tick = grid.scheduler.tick + ticks
+    grid.scheduler = Scheduler(grid.road_cells)
+    grid.scheduler.tick = tick
+    for car in grid.cars:
+        if not car.reached and car.path_index < len(car.path):
+            grid.scheduler.add(car)
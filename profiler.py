@@ -0,0 +1,101 @@
+import time
+import numpy as np
+
+
+# Profiler receiving count() calls, set while a TickProfiler is enabled
+_active = None
+
+
+def count(name, n=1):
+    """Add n to a named counter of the enabled profiler (no-op when profiling is off)."""
+    if _active is not None:
+        _active.counters[name] = _active.counters.get(name, 0) + n
+
+
+class TickProfiler:
+    """Per-phase wall time for every tick, kept in a preallocated array.
+
+    Grid.update calls begin_tick / lap / end_tick only while the profiler is
+    enabled, so switching it off leaves one attribute check per tick.
+    """
+
+    PHASES = ('signals', 'movement', 'statistics', 'routing', 'rendering')
+
+    def __init__(self, capacity=1000):
+        self.times = np.zeros((capacity, len(self.PHASES)))
+        self.ticks = 0
+        self.enabled = False
+        self.counters = {}
+        self._index = {p: i for i, p in enumerate(self.PHASES)}
+        self._last = 0.0
+
+    def enable(self):
+        global _active
+        self.enabled = True
+        _active = self
+
+    def disable(self):
+        global _active
+        self.enabled = False
+        if _active is self:
+            _active = None
+
+    def reset(self):
+        self.times[:] = 0
+        self.ticks = 0
+        self.counters = {}
+
+    # --- Recording ---
+    def begin_tick(self):
+        if self.ticks == len(self.times):
+            self.times = np.concatenate([self.times, np.zeros_like(self.times)])
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.times[self.ticks, self._index[phase]] += now - self._last
+        self._last = now
+
+    def end_tick(self):
+        self.ticks += 1
+
+    def add(self, phase, seconds):
+        """Charge time measured outside Grid.update (e.g. rendering) to the last tick."""
+        self.times[max(self.ticks - 1, 0), self._index[phase]] += seconds
+
+    # --- Reporting ---
+    def summary(self):
+        times = self.times[:self.ticks]
+        total = times.sum()
+        phases = {}
+        for name, column in zip(self.PHASES, times.T):
+            if self.ticks == 0:
+                continue
+            p50, p90, p99 = np.percentile(column, (50, 90, 99))
+            phases[name] = {
+                'total': float(column.sum()),
+                'share': float(column.sum() / total) if total > 0 else 0.0,
+                'mean': float(column.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(column.max()),
+            }
+        return {
+            'ticks': self.ticks,
+            'total': float(total),
+            'ticks_per_second': float(self.ticks / total) if total > 0 else 0.0,
+            'phases': phases,
+            'counters': dict(self.counters),
+        }
+
+    def report(self):
+        s = self.summary()
+        lines = [f"{s['ticks']} ticks in {s['total']:.3f}s ({s['ticks_per_second']:.1f} ticks/s)",
+                 f"{'phase':<12}{'share':>7}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, p in s['phases'].items():
+            lines.append(f"{name:<12}{p['share']:>7.1%}{p['mean'] * 1e3:>10.3f}{p['p50'] * 1e3:>10.3f}"
+                         f"{p['p90'] * 1e3:>10.3f}{p['p99'] * 1e3:>10.3f}{p['max'] * 1e3:>10.3f}")
+        for name, value in sorted(s['counters'].items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
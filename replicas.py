@@ -0,0 +1,140 @@
+import numpy as np
+
+from routing import LaneGraph, batch_routes
+from road_index import RoadIndex
+
+
+class ReplicaEngine:
+    """K stochastic replicas of one city advanced in lockstep.
+
+    The map (cell types, light masks, lane graph) is built once and shared.
+    Occupancy, light phase, car state and random draws all carry a leading
+    replica axis, so one tick of all K replicas is a handful of array
+    operations instead of K * cars calls to Car.update.
+
+    Each replica r gets its own generator seeded with seeds[r], used both
+    for its spawn wave and its move draws, so a replica's run does not
+    depend on how many others are batched with it.
+
+    Movement follows Car.update (hesitation, red light, occupied cell) with
+    one difference: within a sub-step all cars move at once, so a car cannot
+    enter a cell that another car leaves in the same sub-step, and when two
+    cars want the same free cell the lower car id wins.
+    """
+
+    def __init__(self, city, replicas, cars, seeds=None, traffic_light_time=10,
+                 move_probability=0.9, route_processes=None):
+        self.replicas = replicas
+        self.cars = cars
+        self.seeds = list(seeds) if seeds is not None else list(range(replicas))
+        self.traffic_light_time = traffic_light_time
+        self.move_probability = move_probability
+
+        # --- Shared, immutable map over road index ids
+        index = RoadIndex(city)
+        self.index = index
+        self.cells = index.size
+        self.cell_type = index.cell_type
+        self.intersection = self.cell_type == 3
+        self.light_A = index.light_A
+        self.lane_graph = LaneGraph(city, index)
+
+        # --- Per-replica spawn waves, routed in one batch
+        self.rngs = [np.random.default_rng(s) for s in self.seeds]
+        local = np.flatnonzero(self.cell_type == 2)
+        if len(local) < cars + 1:
+            raise ValueError(f"Only {len(local)} local road cells for {cars} cars per replica")
+        starts, dests = [], []
+        for rng in self.rngs:
+            s = rng.choice(local, cars, replace=False)
+            d = rng.choice(local, cars)
+            while np.any(d == s):
+                same = d == s
+                d[same] = rng.choice(local, same.sum())
+            starts.append(s)
+            dests.append(d)
+        starts = np.concatenate(starts)
+        dests = np.concatenate(dests)
+
+        route, route_start = batch_routes(self.lane_graph,
+                                          np.stack([index.ys[starts], index.xs[starts]], axis=1),
+                                          np.stack([index.ys[dests], index.xs[dests]], axis=1),
+                                          processes=route_processes)
+        self.route = index.ids[route[:, 0], route[:, 1]].astype(np.int64)
+        self.route_end = route_start[1:]
+
+        # --- Per-replica dynamic state, flattened over (replica, car)
+        self.replica = np.repeat(np.arange(replicas), cars)
+        self.position = starts.astype(np.int64)
+        self.destination = dests.astype(np.int64)
+        self.path_index = route_start[:-1].copy()
+        self.done = self.path_index >= self.route_end
+        self.time_spent = np.zeros(replicas * cars, dtype=np.int64)
+        self.speed = np.maximum(self.cell_type[starts] // 2, 1)
+        self.max_speed = int(self.speed.max())
+
+        self.occupancy = np.zeros((replicas, self.cells), dtype=bool)
+        live = ~self.done
+        self.occupancy[self.replica[live], self.position[live]] = True
+
+        self.switches = np.zeros(replicas, dtype=np.int64)
+        self.tick = 0
+
+    def step(self):
+        # Lights switch at every multiple of traffic_light_time, as in Model.simulate
+        if self.tick % self.traffic_light_time == 0:
+            self.switches += 1
+        green_A = self.switches % 2 == 0
+
+        n = self.cars
+        draws = np.stack([rng.random((n, self.max_speed)) for rng in self.rngs])
+        draws = draws.reshape(self.replicas * n, self.max_speed)
+
+        started = ~self.done
+        moving = started.copy()
+        for s in range(self.max_speed):
+            c = np.flatnonzero(moving & (self.speed > s))
+            if len(c) == 0:
+                break
+            r = self.replica[c]
+            nxt = self.route[self.path_index[c]]
+
+            ok = draws[c, s] <= self.move_probability
+            ok &= ~(self.intersection[nxt] & (self.light_A[nxt] != green_A[r]))
+            ok &= ~self.occupancy[r, nxt]
+
+            # One winner per free cell: the lowest car id asking for it
+            cand = c[ok]
+            _, first = np.unique(r[ok] * self.cells + nxt[ok], return_index=True)
+            win = cand[first]
+            win_r, win_nxt = self.replica[win], self.route[self.path_index[win]]
+
+            self.occupancy[win_r, self.position[win]] = False
+            self.occupancy[win_r, win_nxt] = True
+            self.position[win] = win_nxt
+            self.path_index[win] += 1
+
+            arrived = win[self.path_index[win] >= self.route_end[win]]
+            self.occupancy[self.replica[arrived], self.position[arrived]] = False
+            self.done[arrived] = True
+
+            moving[c] = False
+            moving[win] = True
+            moving[arrived] = False
+
+        self.time_spent[started] += 1
+        self.tick += 1
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.step()
+
+    def arrived(self):
+        """Number of cars per replica that reached their destination."""
+        return np.bincount(self.replica[self.done & (self.position == self.destination)],
+                           minlength=self.replicas)
+
+    def positions(self, replica):
+        """(y, x) positions of one replica's cars."""
+        sl = slice(replica * self.cars, (replica + 1) * self.cars)
+        return np.stack([self.index.ys[self.position[sl]], self.index.xs[self.position[sl]]], axis=1)
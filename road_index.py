@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class RoadIndex:
+    """Dense ids for road and intersection cells only.
+
+    ids[y, x] is the id of a road cell (-1 elsewhere) and ys/xs map ids back
+    to coordinates; ids follow row-major order. Static attributes (cell type,
+    light group, cluster, segment) and all dynamic per-cell state
+    (occupancy, light state, counters) are arrays over ids, so their size
+    and the work done on them scale with road length, not map area.
+    """
+
+    def __init__(self, city):
+        self.height, self.width = city.height, city.width
+
+        # Inverse id grid; memory-mapped alongside the city when it has storage
+        self.ids = city._layer('road_ids', np.int32, -1)
+        ys, xs, types = [], [], []
+        count = 0
+        for y0, y1 in city._bands():
+            cell_type = np.asarray(city.grid[y0:y1]).astype(np.int8)
+            cell_type[city.intersections[y0:y1]] = 3
+            by, bx = np.nonzero(np.isin(cell_type, (2, 3, 4, 6)))
+            self.ids[y0 + by, bx] = np.arange(count, count + len(by), dtype=np.int32)
+            count += len(by)
+            ys.append(by + y0)
+            xs.append(bx)
+            types.append(cell_type[by, bx])
+
+        self.size = count
+        self.ys = np.concatenate(ys).astype(np.int32)
+        self.xs = np.concatenate(xs).astype(np.int32)
+        self.cell_type = np.concatenate(types)
+        self.light_A = np.asarray(city.light_A)[self.ys, self.xs]
+        self.light_B = np.asarray(city.light_B)[self.ys, self.xs]
+        self.cluster = np.asarray(city.light_cluster)[self.ys, self.xs]
+        self.segment = np.asarray(city.segments)[self.ys, self.xs]
+        self._init_state()
+
+    @classmethod
+    def single(cls, y, x, cell_type):
+        """Index holding one cell, for a Cell built outside a Grid."""
+        index = cls.__new__(cls)
+        index.height, index.width = y + 1, x + 1
+        index.ids = None
+        index.size = 1
+        index.ys = np.array([y], np.int32)
+        index.xs = np.array([x], np.int32)
+        index.cell_type = np.array([cell_type], np.int8)
+        index.light_A = np.zeros(1, bool)
+        index.light_B = np.zeros(1, bool)
+        index.cluster = np.full(1, -1, np.int32)
+        index.segment = np.full(1, -1, np.int32)
+        index._init_state()
+        return index
+
+    def _init_state(self):
+        n = self.size
+        self.occupied = np.zeros(n, bool)
+        self.occupied_by_car = np.zeros(n, bool)
+        self.green = self.light_A.copy()
+        self.cars_passed = np.zeros(n, np.int32)
+        self.lights = np.flatnonzero(self.light_A | self.light_B)
+        self._search = None
+
+    def id_of(self, y, x):
+        return int(self.ids[y, x])
+
+    def search_buffers(self):
+        """g, h, f and parent arrays over ids, shared by every Car on this index."""
+        if self._search is None:
+            n = self.size
+            self._search = (np.full(n, np.inf), np.full(n, np.inf), np.full(n, np.inf),
+                            np.full(n, -1, dtype=np.int64))
+        return self._search
+
+    def switch_lights(self):
+        """Flip every traffic light; returns the ids that flipped."""
+        lights = self.lights[self.cell_type[self.lights] == 3]
+        self.green[lights] = ~self.green[lights]
+        self.occupied[lights] = ~self.green[lights] | self.occupied_by_car[lights]
+        return lights
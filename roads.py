@@ -1,11 +1,26 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import random
+import json
+import os
+
+
+# Layer name -> (dtype, fill value). Road classes fit in int8, masks in bool.
+LAYERS = {
+    'grid':             (np.int8, -1),
+    'original_roads':   (np.bool_, False),
+    'horizontal_roads': (np.bool_, False),
+    'vertical_roads':   (np.bool_, False),
+    'intersections':    (np.bool_, False),
+    'light_A':          (np.bool_, False),
+    'light_B':          (np.bool_, False),
+    'light_cluster':    (np.int32, -1),
+    'segments':         (np.int32, -1),
+}
 
 class City:
     def __init__(self, width, height, block_size_range=(5,10),
                  base_road_width=2, wide_road_width=4, highway_width=6,
-                 road_remove=0.2):
+                 road_remove=0.2, storage=None, tile_size=1024):
         
         self.width = width
         self.height = height
@@ -15,26 +30,56 @@ class City:
         self.highway_width = highway_width
         self.road_remove = road_remove
 
-        self.grid = np.full((height, width), -1.0)
-        self.original_roads = np.zeros((height, width), bool)
-        self.horizontal_roads = np.zeros((height, width), bool)
-        self.vertical_roads   = np.zeros((height, width), bool)
-        self.intersections    = np.zeros((height, width), bool)
-
-        self.light_A = np.zeros((height, width), bool)
-        self.light_B = np.zeros((height, width), bool)
-
-    def _set_road(self, y_slice, x_slice, road_value, record_original=False):
-        ys, ye = y_slice.start or 0, y_slice.stop or self.height
-        xs, xe = x_slice.start or 0, x_slice.stop or self.width
-        current = self.grid[ys:ye, xs:xe]
-        prio   = {2:1, 4:2, 6:3}
-        cur_p  = np.vectorize(prio.get)(current, 0)
-        new_p  = prio.get(road_value, 0)
-        if record_original:
-            self.original_roads[ys:ye, xs:xe] = True
-        mask = new_p > cur_p
-        self.grid[ys:ye, xs:xe][mask] = road_value
+        # With a storage directory every layer is an np.memmap file there,
+        # and all whole-map passes run over bands of tile_size rows
+        self.storage = storage
+        self.tile_size = tile_size
+        self.num_segments = 0
+        if storage is not None:
+            os.makedirs(storage, exist_ok=True)
+        for name, (dtype, fill) in LAYERS.items():
+            setattr(self, name, self._layer(name, dtype, fill))
+
+    @classmethod
+    def load(cls, storage, mode='r+'):
+        """Reopen a memory-mapped city written by generateRoads."""
+        with open(os.path.join(storage, 'city.json')) as f:
+            meta = json.load(f)
+        city = cls.__new__(cls)
+        city.__dict__.update(meta)
+        city.block_size_range = tuple(city.block_size_range)
+        city.storage = storage
+        for name, (dtype, _) in LAYERS.items():
+            setattr(city, name, np.memmap(os.path.join(storage, name + '.dat'), dtype=dtype,
+                                          mode=mode, shape=(city.height, city.width)))
+        return city
+
+    def _layer(self, name, dtype, fill):
+        shape = (self.height, self.width)
+        if self.storage is None:
+            return np.full(shape, fill, dtype)
+        layer = np.memmap(os.path.join(self.storage, name + '.dat'), dtype=dtype, mode='w+', shape=shape)
+        if fill:
+            for y0, y1 in self._bands():
+                layer[y0:y1] = fill
+        return layer
+
+    def _bands(self, step=1):
+        """Row ranges of at most tile_size rows (rounded to a multiple of step)."""
+        rows = max(step, self.tile_size - self.tile_size % step)
+        for y0 in range(0, self.height, rows):
+            yield y0, min(y0 + rows, self.height)
+
+    def _save_meta(self):
+        if self.storage is None:
+            return
+        meta = {k: getattr(self, k) for k in ('width', 'height', 'block_size_range', 'base_road_width',
+                                              'wide_road_width', 'highway_width', 'road_remove',
+                                              'tile_size', 'num_segments')}
+        with open(os.path.join(self.storage, 'city.json'), 'w') as f:
+            json.dump(meta, f)
+        for name in LAYERS:
+            getattr(self, name).flush()
 
     def _spaced_positions(self, length):
         pos = random.randint(*self.block_size_range)
@@ -45,18 +90,34 @@ class City:
         return out
 
     def generateRoads(self):
+        bw = self.base_road_width
         h_pos = self._spaced_positions(self.height)
         v_pos = self._spaced_positions(self.width)
 
+        # Every road spans the whole map, so a cell's class is the larger of
+        # its row's and its column's class; track those per row and column
+        row_class = np.full(self.height, -1, np.int8)
+        col_class = np.full(self.width, -1, np.int8)
+        row_base = np.zeros(self.height, bool)
+        col_base = np.zeros(self.width, bool)
+        row_road = np.zeros(self.height, bool)
+        col_road = np.zeros(self.width, bool)
+
+        def set_rows(y_slice, value):
+            row_class[y_slice] = np.maximum(row_class[y_slice], value)
+            row_road[y_slice] = True
+
+        def set_cols(x_slice, value):
+            col_class[x_slice] = np.maximum(col_class[x_slice], value)
+            col_road[x_slice] = True
+
         for y in h_pos:
-            self._set_road(slice(y, y + self.base_road_width),
-                           slice(0, self.width), 2, True)
-            self.horizontal_roads[y:y + self.base_road_width, :] = True
+            set_rows(slice(y, y + bw), 2)
+            row_base[y:y + bw] = True
 
         for x in v_pos:
-            self._set_road(slice(0, self.height),
-                           slice(x, x + self.base_road_width), 2, True)
-            self.vertical_roads[:, x:x + self.base_road_width] = True
+            set_cols(slice(x, x + bw), 2)
+            col_base[x:x + bw] = True
 
         axis = (random.choice(['h','v'])
                 if h_pos and v_pos
@@ -64,121 +125,196 @@ class City:
 
         if axis == 'h':
             y0 = random.choice(h_pos)
-            start = max(0, y0 + self.base_road_width//2 - self.highway_width//2)
+            start = max(0, y0 + bw//2 - self.highway_width//2)
             end   = min(self.height, start + self.highway_width)
-            y_slice = slice(start + 2, end - 2)
-            self._set_road(y_slice, slice(0, self.width), 6)
-            self.horizontal_roads[y_slice, :] = True
+            set_rows(slice(start + 2, end - 2), 6)
 
             for x0 in random.sample(v_pos, min(len(v_pos), random.randint(1,3))):
-                c0 = max(0, x0 + self.base_road_width//2 - self.wide_road_width//2)
+                c0 = max(0, x0 + bw//2 - self.wide_road_width//2)
                 c1 = min(self.width, c0 + self.wide_road_width)
-                x_slice = slice(c0 + 1, c1 - 1)
-                self._set_road(slice(0, self.height), x_slice, 4)
-                self.vertical_roads[:, x_slice] = True
+                set_cols(slice(c0 + 1, c1 - 1), 4)
 
         else:
             x0 = random.choice(v_pos)
-            start = max(0, x0 + self.base_road_width//2 - self.highway_width//2)
+            start = max(0, x0 + bw//2 - self.highway_width//2)
             end   = min(self.width, start + self.highway_width)
-            x_slice = slice(start + 2, end - 2)
-            self._set_road(slice(0, self.height), x_slice, 6)
-            self.vertical_roads[:, x_slice] = True
+            set_cols(slice(start + 2, end - 2), 6)
 
             for y0 in random.sample(h_pos, min(len(h_pos), random.randint(1,3))):
-                c0 = max(0, y0 + self.base_road_width//2 - self.wide_road_width//2)
+                c0 = max(0, y0 + bw//2 - self.wide_road_width//2)
                 c1 = min(self.height, c0 + self.wide_road_width)
-                y_slice = slice(c0 + 1, c1 - 1)
-                self._set_road(y_slice, slice(0, self.width), 4)
-                self.horizontal_roads[y_slice, :] = True
+                set_rows(slice(c0 + 1, c1 - 1), 4)
 
+        def all_local(rows, cols):
+            return np.all(np.maximum(row_class[rows, None], col_class[None, cols]) == 2)
+
+        # Drop random local segments between intersections (same draws as
+        # checking the full grid cell by cell)
+        removed = []  # (y0, y1, x0, x1, layer)
         for y in h_pos:
             for i in range(len(v_pos) - 1):
-                x1 = v_pos[i] + self.base_road_width
+                x1 = v_pos[i] + bw
                 x2 = v_pos[i + 1]
-                seg = self.grid[y:y + self.base_road_width, x1:x2]
-                if np.all(seg == 2) and random.random() < self.road_remove:
-                    self.grid[y:y + self.base_road_width, x1:x2] = -1
-                    self.original_roads[y:y + self.base_road_width, x1:x2] = False
-                    self.horizontal_roads[y:y + self.base_road_width, x1:x2] = False
+                if all_local(slice(y, y + bw), slice(x1, x2)) and random.random() < self.road_remove:
+                    removed.append((y, y + bw, x1, x2, 'horizontal_roads'))
 
         for x in v_pos:
             for i in range(len(h_pos) - 1):
-                y1 = h_pos[i] + self.base_road_width
+                y1 = h_pos[i] + bw
                 y2 = h_pos[i + 1]
-                seg = self.grid[y1:y2, x:x + self.base_road_width]
-                if np.all(seg == 2) and random.random() < self.road_remove:
-                    self.grid[y1:y2, x:x + self.base_road_width] = -1
-                    self.original_roads[y1:y2, x:x + self.base_road_width] = False
-                    self.vertical_roads[y1:y2, x:x + self.base_road_width] = False
+                if all_local(slice(y1, y2), slice(x, x + bw)) and random.random() < self.road_remove:
+                    removed.append((y1, y2, x, x + bw, 'vertical_roads'))
+
+        # Write the layers band by band
+        rows = max(1, self.tile_size)
+        by_band = {}
+        for rect in removed:
+            for b in range(rect[0] // rows, (max(rect[1], rect[0] + 1) - 1) // rows + 1):
+                by_band.setdefault(b, []).append(rect)
+
+        for y0, y1 in self._bands():
+            n = y1 - y0
+            grid = np.maximum(row_class[y0:y1, None], col_class[None, :])
+            original = row_base[y0:y1, None] | col_base[None, :]
+            layers = {'horizontal_roads': np.repeat(row_road[y0:y1, None], self.width, axis=1),
+                      'vertical_roads': np.repeat(col_road[None, :], n, axis=0)}
+            for ry0, ry1, rx0, rx1, layer in by_band.get(y0 // rows, []):
+                ys = slice(max(ry0, y0) - y0, min(ry1, y1) - y0)
+                grid[ys, rx0:rx1] = -1
+                original[ys, rx0:rx1] = False
+                layers[layer][ys, rx0:rx1] = False
+
+            self.grid[y0:y1] = grid
+            self.original_roads[y0:y1] = original
+            self.horizontal_roads[y0:y1] = layers['horizontal_roads']
+            self.vertical_roads[y0:y1] = layers['vertical_roads']
+            self.intersections[y0:y1] = layers['horizontal_roads'] & layers['vertical_roads']
 
-        self.intersections = self.horizontal_roads & self.vertical_roads
         self._assign_light_masks()
+        self._label_segments()
+        self._save_meta()
 
 
     def _assign_light_masks(self):
-        h, w = self.intersections.shape
-        self.light_A[:] = False
-        self.light_B[:] = False
-        visited = np.zeros_like(self.intersections, bool)
-
-        for i in range(h):
-            for j in range(w):
-                if self.intersections[i, j] and not visited[i, j]:
-                    stack = [(i, j)]
-                    comp  = []
-                    visited[i, j] = True
-                    while stack:
-                        r, c = stack.pop()
-                        comp.append((r, c))
-                        for dr, dc in ((1,0),(-1,0),(0,1),(0,-1)):
-                            rr, cc = r+dr, c+dc
-                            if 0<=rr<h and 0<=cc<w \
-                               and self.intersections[rr,cc] \
-                               and not visited[rr,cc]:
-                                visited[rr,cc] = True
-                                stack.append((rr,cc))
-
-                    rows = [r for r,_ in comp]
-                    cols = [c for _,c in comp]
-                    rmin, rmax = min(rows), max(rows)
-                    cmin, cmax = min(cols), max(cols)
-                    rmid = (rmin + rmax + 1)//2
-                    cmid = (cmin + cmax + 1)//2
-
-                    for r, c in comp:
-                        if (r < rmid and c < cmid) or (r >= rmid and c >= cmid):
-                            self.light_A[r, c] = True
-                        else:
-                            self.light_B[r, c] = True
-
-
-    def _build_rgb(self):
+        h, w = self.height, self.width
+        # Plain views: element access on np.memmap itself is slow
+        intersections = np.asarray(self.intersections)
+        light_A = np.asarray(self.light_A)
+        light_B = np.asarray(self.light_B)
+        light_cluster = np.asarray(self.light_cluster)  # doubles as the visited mask
+        for y0, y1 in self._bands():
+            light_A[y0:y1] = False
+            light_B[y0:y1] = False
+            light_cluster[y0:y1] = -1
+        cluster_id = 0
+
+        for y0, y1 in self._bands():
+            for i, j in zip(*np.nonzero(intersections[y0:y1])):
+                i += y0
+                if light_cluster[i, j] >= 0:
+                    continue
+                stack = [(i, j)]
+                comp  = []
+                light_cluster[i, j] = cluster_id
+                while stack:
+                    r, c = stack.pop()
+                    comp.append((r, c))
+                    for dr, dc in ((1,0),(-1,0),(0,1),(0,-1)):
+                        rr, cc = r+dr, c+dc
+                        if 0<=rr<h and 0<=cc<w \
+                           and intersections[rr,cc] \
+                           and light_cluster[rr,cc] < 0:
+                            light_cluster[rr,cc] = cluster_id
+                            stack.append((rr,cc))
+
+                rows = [r for r,_ in comp]
+                cols = [c for _,c in comp]
+                rmin, rmax = min(rows), max(rows)
+                cmin, cmax = min(cols), max(cols)
+                rmid = (rmin + rmax + 1)//2
+                cmid = (cmin + cmax + 1)//2
+
+                for r, c in comp:
+                    if (r < rmid and c < cmid) or (r >= rmid and c >= cmid):
+                        light_A[r, c] = True
+                    else:
+                        light_B[r, c] = True
+                cluster_id += 1
+
+
+    def _label_segments(self):
+        # A segment is a straight run of lane cells between intersections:
+        # runs along a row for horizontal roads, along a column for vertical.
+        # Ids are handed out in row-major order of each run's first cell, so
+        # vertical runs carry their id from one band into the next.
+        count = 0
+        above = np.zeros(self.width, bool)
+        above_id = np.full(self.width, -1, np.int64)
+
+        for y0, y1 in self._bands():
+            inter = self.intersections[y0:y1]
+            horiz = self.horizontal_roads[y0:y1] & ~inter
+            vert  = self.vertical_roads[y0:y1] & ~inter
+
+            h_start = horiz.copy()
+            h_start[:, 1:] &= ~horiz[:, :-1]
+            v_start = vert.copy()
+            v_start[0] &= ~above
+            v_start[1:] &= ~vert[:-1]
+
+            starts = h_start | v_start
+            ids = np.cumsum(starts.ravel()).reshape(starts.shape) - 1 + count
+            count += int(starts.sum())
+
+            h_ids = np.maximum.accumulate(np.where(h_start, ids, -1), axis=1)
+            v_ids = np.maximum.accumulate(np.vstack([above_id[None], np.where(v_start, ids, -1)]), axis=0)[1:]
+
+            self.segments[y0:y1] = np.where(horiz, h_ids, np.where(vert, v_ids, -1))
+            above = vert[-1]
+            above_id = np.where(above, v_ids[-1], -1)
+
+        self.num_segments = count
+
+    def _build_rgb(self, step=1, phase=None, mark_intersections=False):
+        """RGB image of every step-th cell, built band by band.
+
+        phase 0/1 colours light_A/light_B green/red (or the reverse), and
+        mark_intersections paints all intersections red.
+        """
         cmap = {-1:[250,250,250], 2:[180,180,180], 4:[100,100,100], 6:[0,0,0]}
-        rgb = np.zeros((self.height, self.width, 3), np.uint8)
-        for k,c in cmap.items():
-            rgb[self.grid==k] = c
+        rgb = np.zeros((-(-self.height // step), -(-self.width // step), 3), np.uint8)
+        for y0, y1 in self._bands(step):
+            out = rgb[y0 // step:-(-y1 // step)]
+            grid = self.grid[y0:y1:step, ::step]
+            for k,c in cmap.items():
+                out[grid==k] = c
+            if mark_intersections:
+                out[self.intersections[y0:y1:step, ::step]] = [255,0,0]
+            if phase is not None:
+                green, red = ([0,255,0], [255,0,0]) if phase % 2 == 0 else ([255,0,0], [0,255,0])
+                out[self.light_A[y0:y1:step, ::step]] = green
+                out[self.light_B[y0:y1:step, ::step]] = red
         return rgb
 
-    def plot_city_grid(self):
-        rgb = self._build_rgb()
-        rgb[self.intersections] = [255,0,0]
+    def _plot_step(self, max_pixels):
+        # Large maps are shown downsampled so the image fits in memory
+        return max(1, -(-max(self.height, self.width) // max_pixels))
+
+    def plot_city_grid(self, max_pixels=2000):
+        import matplotlib.pyplot as plt
+        rgb = self._build_rgb(self._plot_step(max_pixels), mark_intersections=True)
         plt.figure(figsize=(10,10))
         plt.imshow(rgb, origin='upper')
         plt.axis('off')
         plt.show()
 
-    def animate_traffic(self, steps, interval=0.5):
+    def animate_traffic(self, steps, interval=0.5, max_pixels=2000):
+        import matplotlib.pyplot as plt
+        step = self._plot_step(max_pixels)
         plt.ion()
         fig, ax = plt.subplots(figsize=(10,10))
         for t in range(steps):
-            base = self._build_rgb()
-            if t % 2 == 0:
-                base[self.light_A] = [  0,255,  0]
-                base[self.light_B] = [255,  0,  0]
-            else:
-                base[self.light_A] = [255,  0,  0]
-                base[self.light_B] = [  0,255,  0]
+            base = self._build_rgb(step, phase=t)
             ax.clear()
             ax.imshow(base, origin='upper')
             ax.axis('off')
@@ -0,0 +1,239 @@
+import heapq
+import os
+import numpy as np
+import multiprocessing as mp
+
+import profiler
+from parallel import _share, _attach
+from road_index import RoadIndex
+
+
+class LaneGraph:
+    """The city's drivable moves compiled into flat CSR arrays.
+
+    Nodes are road index ids (see RoadIndex). Edges follow the same rules as
+    Car.is_within_grid and Car.is_on_correct_lane: the target must be a road
+    or intersection, and outside intersections a car keeps to the right-hand
+    lane of its direction. Neighbours are stored in the order Car.a_star_search
+    visits them (N, S, W, E) so both searches break ties the same way.
+    """
+
+    MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+    def __init__(self, city, index=None):
+        self.height, self.width = city.height, city.width
+        self.index = index if index is not None else RoadIndex(city)
+        ids = np.asarray(self.index.ids).reshape(-1)
+        bands = list(city._bands())
+        first = np.searchsorted(self.index.ys, [y0 for y0, _ in bands] + [self.height])
+
+        # Two passes over row bands: count edges per node, then fill them in.
+        # Memory-mapped cities get memory-mapped graph arrays next to them.
+        self.indptr = self._array(city, 'lane_indptr', self.index.size + 1, np.int64)
+        self.indptr[0] = 0
+        total = 0
+        for b, (y0, y1) in enumerate(bands):
+            src, _ = self._band_edges(city, y0, y1)
+            lo, hi = first[b], first[b + 1]
+            counts = np.bincount(ids[src] - lo, minlength=hi - lo)
+            self.indptr[lo + 1:hi + 1] = total + np.cumsum(counts)
+            total += len(src)
+
+        self.indices = self._array(city, 'lane_indices', total, np.int32)
+        for b, (y0, y1) in enumerate(bands):
+            _, dst = self._band_edges(city, y0, y1)
+            self.indices[self.indptr[first[b]]:self.indptr[first[b + 1]]] = ids[dst]
+
+    @staticmethod
+    def _array(city, name, size, dtype):
+        storage = getattr(city, 'storage', None)
+        if storage is None:
+            return np.zeros(size, dtype)
+        return np.memmap(os.path.join(storage, name + '.dat'), dtype=dtype, mode='w+', shape=(max(size, 1),))[:size]
+
+    def _band_edges(self, city, y0, y1):
+        """Edges leaving rows y0..y1, sorted by source then move order."""
+        h, w = self.height, self.width
+        lo, hi = max(y0 - 1, 0), min(y1 + 1, h)
+
+        # Rows y0-1 .. y1 (one halo row each side), padded with non-road
+        cell_type = np.full((y1 - y0 + 2, w + 2), -1, np.int8)
+        window = cell_type[lo - y0 + 1:hi - y0 + 1, 1:-1]
+        window[:] = city.grid[lo:hi]
+        window[city.intersections[lo:hi]] = 3
+        road = np.isin(cell_type, (2, 3, 4, 6))
+        inter = cell_type == 3
+
+        # Lane edges: first/last cell of the contiguous road run across the move
+        lane_ok = {(-1, 0): ~road[1:-1, 2:],   # north uses the right lane
+                   (1, 0): ~road[1:-1, :-2],   # south uses the left lane
+                   (0, -1): ~road[:-2, 1:-1],  # west uses the top lane
+                   (0, 1): ~road[2:, 1:-1]}    # east uses the bottom lane
+
+        ys, xs = np.nonzero(road[1:-1, 1:-1])
+        src_list, dst_list, order_list = [], [], []
+        for k, (dy, dx) in enumerate(self.MOVES):
+            ny, nx = ys + dy, xs + dx
+            ok = road[ny + 1, nx + 1] & (inter[ys + 1, xs + 1] | inter[ny + 1, nx + 1] | lane_ok[(dy, dx)][ys, xs])
+            src_list.append((ys[ok] + y0) * w + xs[ok])
+            dst_list.append((ny[ok] + y0) * w + nx[ok])
+            order_list.append(np.full(ok.sum(), k))
+
+        src = np.concatenate(src_list)
+        dst = np.concatenate(dst_list)
+        order = np.lexsort((np.concatenate(order_list), src))
+        return src[order], dst[order].astype(np.int32)
+
+    def arrays(self):
+        return {'indptr': self.indptr, 'indices': self.indices, 'ys': self.index.ys, 'xs': self.index.xs}
+
+
+def _search(indptr, indices, ys, xs, source, destination, cost, g, parent, touched):
+    """A* from source to destination (road ids). Returns the path without its start cell."""
+    dy_, dx_ = int(ys[destination]), int(xs[destination])
+
+    def heuristic(node):
+        y, x = int(ys[node]), int(xs[node])
+        return ((y - dy_) ** 2 + (x - dx_) ** 2) ** 0.5
+
+    for node in touched:
+        g[node] = np.inf
+        parent[node] = -1
+    touched.clear()
+
+    g[source] = 0
+    parent[source] = source
+    touched.append(source)
+    # (f, y, x, id): ties break on coordinates, as in Car.a_star_search
+    open_list = [(heuristic(source), int(ys[source]), int(xs[source]), source)]
+    closed = set()
+    found = False
+    expanded = 0
+
+    while open_list and not found:
+        node = heapq.heappop(open_list)[3]
+        if node in closed:
+            continue
+        closed.add(node)
+        expanded += 1
+
+        for k in range(indptr[node], indptr[node + 1]):
+            nxt = int(indices[k])
+            if nxt == destination:
+                if parent[nxt] == -1:
+                    touched.append(nxt)
+                parent[nxt] = node
+                found = True
+                break
+            if nxt in closed:
+                continue
+            g_new = g[node] + (1 if cost is None else cost[nxt])
+            if g[nxt] > g_new:
+                if parent[nxt] == -1:
+                    touched.append(nxt)
+                g[nxt] = g_new
+                parent[nxt] = node
+                heapq.heappush(open_list, (g_new + heuristic(nxt), int(ys[nxt]), int(xs[nxt]), nxt))
+
+    profiler.count('astar_searches')
+    profiler.count('astar_expansions', expanded)
+    if not found:
+        return []
+    path = []
+    node = destination
+    while node != source:
+        path.append(node)
+        node = int(parent[node])
+    path.reverse()
+    return path
+
+
+# --- Worker pool state, attached once per process ---
+_worker = {}
+
+
+def _init_worker(specs, has_cost):
+    blocks, arrays = _attach(specs)
+    _setup(arrays, has_cost)
+    _worker['blocks'] = blocks
+
+
+def _setup(arrays, has_cost):
+    _worker.clear()
+    _worker.update(arrays)
+    _worker['has_cost'] = has_cost
+    size = len(arrays['indptr']) - 1
+    _worker['g'] = np.full(size, np.inf)
+    _worker['parent'] = np.full(size, -1, dtype=np.int64)
+    _worker['touched'] = []
+
+
+def _route_chunk(bounds):
+    start, stop = bounds
+    w = _worker
+    cost = w['cost'] if w['has_cost'] else None
+    lengths, flat = [], []
+    for source, destination in w['pairs'][start:stop]:
+        if source < 0 or destination < 0:
+            path = []  # not a road cell
+        else:
+            path = _search(w['indptr'], w['indices'], w['ys'], w['xs'], int(source), int(destination),
+                           cost, w['g'], w['parent'], w['touched'])
+        lengths.append(len(path))
+        flat.extend(path)
+    return np.array(lengths, dtype=np.int64), np.array(flat, dtype=np.int64)
+
+
+def batch_routes(graph, sources, destinations, cost=None, processes=None, chunk_size=64):
+    """Route many (source, destination) pairs at once.
+
+    `sources` and `destinations` are (N, 2) arrays of (y, x) cells; `cost`
+    is an optional travel cost per road index id. The lane graph, the pairs
+    and the cost are placed in shared memory
+    and a process pool attaches to them once, so the map is never pickled;
+    only chunk bounds go out and flat routes come back. Small batches or
+    processes=1 run in the calling process.
+
+    Returns (route, route_start): route is an (M, 2) array of (y, x) cells,
+    and the path of pair k (without its start cell) is
+    route[route_start[k]:route_start[k + 1]]. Unreachable pairs get an
+    empty path.
+    """
+    index = graph.index
+    sources = np.asarray(sources, dtype=np.int64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.int64).reshape(-1, 2)
+    pairs = np.stack([index.ids[sources[:, 0], sources[:, 1]],
+                      index.ids[destinations[:, 0], destinations[:, 1]]], axis=1).astype(np.int64)
+    n = len(pairs)
+
+    processes = processes or mp.cpu_count()
+    bounds = [(s, min(s + chunk_size, n)) for s in range(0, n, chunk_size)]
+
+    arrays = dict(graph.arrays(), pairs=pairs)
+    if cost is not None:
+        arrays['cost'] = np.ascontiguousarray(cost, dtype=np.float64)
+
+    if processes == 1 or len(bounds) <= 1:
+        _setup(arrays, cost is not None)
+        results = [_route_chunk(b) for b in bounds]
+        _worker.clear()
+    else:
+        blocks, specs = [], {}
+        try:
+            for name, array in arrays.items():
+                _share(blocks, specs, name, array)
+            with mp.get_context().Pool(processes, initializer=_init_worker,
+                                       initargs=(specs, cost is not None)) as pool:
+                results = pool.map(_route_chunk, bounds)
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    lengths = np.concatenate([r[0] for r in results]) if results else np.zeros(0, dtype=np.int64)
+    flat = np.concatenate([r[1] for r in results]) if results else np.zeros(0, dtype=np.int64)
+    route_start = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=route_start[1:])
+    route = np.stack([index.ys[flat], index.xs[flat]], axis=1).astype(np.int32)
+    return route, route_start
+
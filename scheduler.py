@@ -0,0 +1,88 @@
+class Scheduler:
+    """Active-set scheduler: only cars that can move are updated each tick.
+
+    A car that gets blocked is parked on a wake-up list keyed by what it
+    waits on (a traffic light cluster or an occupied cell). Cells call
+    back into the scheduler when a light flips or a car leaves, and the
+    waiting cars are put back into the active set.
+    """
+
+    def __init__(self, road_cells):
+        self.active = {}          # car_id -> car, kept in insertion order
+        self.waiting = {}         # ('light', cluster) / ('cell', (y, x)) -> [cars]
+        self.tick = 0
+        self._in_step = False
+
+        for cell in road_cells:
+            cell.scheduler = self
+
+    def add(self, car):
+        self.active[car.car_id] = car
+
+    def num_active(self):
+        return len(self.active)
+
+    def num_parked(self):
+        return sum(len(cars) for cars in self.waiting.values())
+
+    # --- Wake-up callbacks (called from Cell) ---
+    def light_changed(self, cell):
+        self._wake(('light', cell.cluster))
+
+    def lights_changed(self, clusters):
+        """Wake cars waiting on any of the given light clusters, in order."""
+        for cluster in dict.fromkeys(clusters.tolist()):
+            self._wake(('light', cluster))
+
+    def cell_vacated(self, cell):
+        self._wake(('cell', (cell.y, cell.x)))
+
+    def _wake(self, key):
+        cars = self.waiting.pop(key, None)
+        if not cars:
+            return
+        # Woken mid-tick cars run next tick, woken between ticks run this one
+        missed = self.tick - (0 if self._in_step else 1)
+        for car in cars:
+            # Keep time_spent as if the car had been updated while parked
+            car.time_spent += missed - car.parked_at
+            self.active[car.car_id] = car
+
+    def wake_car(self, car):
+        """Re-activate a single parked car, e.g. after it was given a new route."""
+        if car.car_id in self.active or car.blocked_on is None:
+            return
+        cars = self.waiting.get(car.blocked_on, [])
+        if car in cars:
+            cars.remove(car)
+            if not cars:
+                del self.waiting[car.blocked_on]
+            car.time_spent += self.tick - (0 if self._in_step else 1) - car.parked_at
+            self.active[car.car_id] = car
+
+    def settle(self):
+        """Credit every parked car with the ticks it has waited so far.
+
+        Parked cars are only caught up when woken; call this before reading
+        time_spent, or before the scheduler is replaced.
+        """
+        done = self.tick - (0 if self._in_step else 1)
+        for cars in self.waiting.values():
+            for car in cars:
+                car.time_spent += done - car.parked_at
+                car.parked_at = done
+
+    # --- Tick ---
+    def step(self):
+        self._in_step = True
+        for car in list(self.active.values()):
+            car.update()
+
+            if car.reached or car.path_index >= len(car.path):
+                del self.active[car.car_id]
+            elif car.blocked_on is not None:
+                del self.active[car.car_id]
+                car.parked_at = self.tick
+                self.waiting.setdefault(car.blocked_on, []).append(car)
+        self._in_step = False
+        self.tick += 1
@@ -0,0 +1,222 @@
+import asyncio
+import struct
+import threading
+import numpy as np
+
+
+# Message kinds
+MAP, KEY, DELTA = 0, 1, 2
+
+# Every message is a uint32 length followed by the payload. The payload starts
+# with kind, tick and three counts whose meaning depends on the kind:
+#   MAP         height, width, roads | ys int32, xs int32, cell_type int8
+#   KEY, DELTA  cells, cars, lights  | cell ids int32, occupied uint8,
+#                                      car rows (car, y, x) int32, light ids int32, green uint8
+# A KEY frame lists every occupied cell, every car and every light; a DELTA
+# frame lists only what changed since the previous tick. Cars are numbered by
+# their position in grid.cars, and a car that reached its destination is at (-1, -1).
+HEADER = struct.Struct('<BqIII')
+LENGTH = struct.Struct('<I')
+
+
+def _message(kind, tick, counts, arrays):
+    body = b''.join(np.ascontiguousarray(a).tobytes() for a in arrays)
+    payload = HEADER.pack(kind, tick, *counts) + body
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode(payload):
+    """Decode one message payload (without its length prefix) into a dict."""
+    kind, tick, a, b, c = HEADER.unpack_from(payload)
+    buf = memoryview(payload)[HEADER.size:]
+    if kind == MAP:
+        ys = np.frombuffer(buf, np.int32, c, 0)
+        xs = np.frombuffer(buf, np.int32, c, 4 * c)
+        cell_type = np.frombuffer(buf, np.int8, c, 8 * c)
+        return {'kind': kind, 'height': a, 'width': b, 'ys': ys, 'xs': xs, 'cell_type': cell_type}
+
+    offset = 0
+
+    def take(dtype, count):
+        nonlocal offset
+        out = np.frombuffer(buf, dtype, count, offset)
+        offset += out.nbytes
+        return out
+
+    cells, occupied = take(np.int32, a), take(np.uint8, a).astype(bool)
+    cars = take(np.int32, 3 * b).reshape(b, 3)
+    lights, green = take(np.int32, c), take(np.uint8, c).astype(bool)
+    return {'kind': kind, 'tick': tick, 'cells': cells, 'occupied': occupied,
+            'cars': cars, 'lights': lights, 'green': green}
+
+
+async def frames(host='127.0.0.1', port=8765):
+    """Yield decoded messages from a running TelemetryServer."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+            yield decode(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return
+    finally:
+        writer.close()
+
+
+class _Client:
+    def __init__(self, writer, queue_frames):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_frames)
+        self.needs_key = True
+        self.dropped = 0
+
+
+class TelemetryServer:
+    """Publishes per-tick deltas of a Grid to local TCP clients.
+
+    The asyncio loop runs in a daemon thread, so Grid.update only diffs the
+    state against the previous tick and hands one encoded frame to the loop.
+    Every client has a bounded queue: when it is full the frame is dropped
+    for that client, which then gets a KEY frame with the full state as soon
+    as it has room again. A slow client therefore never blocks the
+    simulation or the other clients.
+    """
+
+    def __init__(self, grid, host='127.0.0.1', port=8765, queue_frames=8):
+        self.host = host
+        self.port = port
+        self.queue_frames = queue_frames
+        self.index = grid.index
+        self.clients = []
+        self.tick = -1
+
+        index = grid.index
+        self.lights = index.lights[index.cell_type[index.lights] == 3]
+        self.map = _message(MAP, 0, (grid.height, grid.width, index.size),
+                            (index.ys, index.xs, index.cell_type.astype(np.int8)))
+        self.occupied = index.occupied_by_car.copy()
+        self.green = index.green[self.lights]
+        self.positions = np.zeros((0, 2), dtype=np.int32)
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._error = None
+        self._want_key = False
+
+    # --- Server thread ---
+    def start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._error is not None:
+            # e.g. the port is taken; the thread has already ended
+            self._thread.join()
+            self._loop = None
+            raise self._error
+        return self
+
+    def _run(self, ready):
+        try:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except Exception as e:
+            self._error = e
+            if self._loop is not None:
+                self._loop.close()
+            return
+        finally:
+            ready.set()
+        self._loop.run_forever()
+
+        # Shut down: stop accepting, end every client task, then close the loop
+        self._server.close()
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    async def _serve(self, reader, writer):
+        client = _Client(writer, self.queue_frames)
+        client.queue.put_nowait(self.map)
+        self.clients.append(client)
+        self._want_key = True
+        try:
+            while True:
+                writer.write(await client.queue.get())
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.remove(client)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    def _broadcast(self, delta, key):
+        for client in self.clients:
+            if client.needs_key:
+                if key is None or client.queue.full():
+                    client.dropped += 1
+                    continue
+                client.queue.put_nowait(key)
+                client.needs_key = False
+            elif client.queue.full():
+                client.dropped += 1
+                client.needs_key = True
+            else:
+                client.queue.put_nowait(delta)
+        if any(client.needs_key for client in self.clients):
+            self._want_key = True
+
+    # --- Simulation side ---
+    def publish(self, tick, fleet):
+        """Diff a FleetSnapshot and the grid against the previous tick and queue the frame for every client."""
+        index = self.index
+        positions = fleet.positions.copy()
+        positions[fleet.reached] = -1
+        green = index.green[self.lights]
+
+        if self._loop is not None and self.clients:
+            cells = np.flatnonzero(index.occupied_by_car != self.occupied).astype(np.int32)
+            moved = np.arange(len(positions), dtype=np.int32)
+            if len(self.positions):
+                same = np.zeros(len(positions), dtype=bool)
+                same[:len(self.positions)] = np.all(positions[:len(self.positions)] == self.positions, axis=1)
+                moved = moved[~same]
+            flipped = np.flatnonzero(green != self.green)
+            delta = self._frame(DELTA, tick, cells, moved, positions, flipped, green)
+
+            key = None
+            if self._want_key:
+                self._want_key = False
+                key = self._frame(KEY, tick, np.flatnonzero(index.occupied_by_car).astype(np.int32),
+                                  np.arange(len(positions), dtype=np.int32), positions,
+                                  np.arange(len(self.lights)), green)
+            self._loop.call_soon_threadsafe(self._broadcast, delta, key)
+
+        self.occupied = index.occupied_by_car.copy()
+        self.green = green
+        self.positions = positions
+        self.tick = tick
+
+    def _frame(self, kind, tick, cells, cars, positions, lights, green):
+        car_rows = np.column_stack([cars, positions[cars]]).astype(np.int32)
+        return _message(kind, tick, (len(cells), len(cars), len(lights)),
+                        (cells, self.index.occupied_by_car[cells].astype(np.uint8), car_rows,
+                         self.lights[lights].astype(np.int32), green[lights].astype(np.uint8)))
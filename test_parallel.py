@@ -0,0 +1,52 @@
+import io
+import random
+import sys
+
+import numpy as np
+import pytest
+
+from grid import Grid
+from main import spawn_cars
+import parallel
+
+
+def _grid(seed=3, cars=300):
+    random.seed(seed)
+    np.random.seed(seed)
+    out, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        grid = Grid(150, 150)
+        spawn_cars(grid, cars, np.random.default_rng(seed), processes=1)
+    finally:
+        sys.stdout = out
+    return grid
+
+
+def _run(tiles, ticks=150):
+    grid = _grid()
+    result = parallel.simulate_tiled(grid, ticks, tiles, seed=7)
+    return grid, result
+
+
+@pytest.mark.parametrize('tiles', [(1, 1), (2, 2), (3, 2)])
+def test_tiled_run_is_reproducible(tiles):
+    _, first = _run(tiles)
+    _, second = _run(tiles)
+    for name in ('position', 'path_index', 'done', 'time_spent', 'owner'):
+        assert np.array_equal(first[name], second[name]), name
+
+
+@pytest.mark.parametrize('tiles', [(1, 1), (2, 2), (3, 2)])
+def test_live_cars_never_share_a_cell(tiles):
+    grid, result = _run(tiles)
+    live = result['position'][~result['done']]
+    assert len(set(map(tuple, live.tolist()))) == len(live)
+    assert int(grid.index.occupied_by_car.sum()) == len(live)
+
+
+def test_write_back_continues_tick_numbering():
+    grid = _grid()
+    for _ in range(5):
+        grid.update()
+    parallel.simulate_tiled(grid, 20, (2, 2))
+    assert grid.scheduler.tick == 25
@@ -0,0 +1,85 @@
+import hashlib
+import random
+
+import numpy as np
+import pytest
+
+from roads import City, LAYERS
+
+
+SHAPES = [(100, 120, (10, 30)), (200, 150, (5, 10)), (57, 300, (10, 30))]
+
+# Digests of maps from the generator before banding and compact dtypes
+# (seeds 0-9 per shape), see _digest
+BASELINE = {
+    (100, 120, (10, 30)): ['9a8be88da231a59b', 'cd557fa645d9b991', 'bc8a24d4478a3486', '5cb6237004751dc1',
+                           'f91248dec3f17ce5', '3dba385b4aba4fb8', 'bea21603eeab993c', '5a89db5c20f0f9c6',
+                           '58245af53dd49bd6', '89e30969e1434eb9'],
+    (200, 150, (5, 10)): ['2d4eb61bc967c064', 'c3594f81b4432154', 'f020a58368988455', '506ac8f267e072aa',
+                          '9d80aa1119b551b6', '326093dfbaab08d9', '1fd7f240b794c47a', 'b9078e4939bb3cf2',
+                          '67c450913c8c8e8e', '7c5d903eafa73f42'],
+    (57, 300, (10, 30)): ['6a35e1ac8c138926', 'd750945f2f912ca4', 'ce8767d5f1f7fd8a', 'a8a91252d912b70f',
+                          '7fc85fe178c42d4b', '3e2243fd1bbbdcca', 'a7bb5e0c94653906', '4395c0846a7fc13c',
+                          '42e463cbf00dde24', 'b14ac2ea1bd97d5e'],
+}
+
+MASKS = ['grid', 'original_roads', 'horizontal_roads', 'vertical_roads', 'intersections',
+         'light_A', 'light_B', 'light_cluster']
+
+
+def _canonical_segments(segments):
+    # Segment ids renumbered by first appearance, so only the partition counts
+    seg = np.asarray(segments).ravel()
+    out = np.full(seg.shape, -1, dtype=np.int64)
+    ids = seg[seg >= 0]
+    if len(ids):
+        unique, first = np.unique(ids, return_index=True)
+        relabel = np.empty(unique.max() + 1, dtype=np.int64)
+        relabel[unique[np.argsort(first)]] = np.arange(len(unique))
+        out[seg >= 0] = relabel[ids]
+    return out
+
+
+def _digest(city):
+    h = hashlib.sha1()
+    for name in MASKS:
+        h.update(np.ascontiguousarray(np.asarray(getattr(city, name)).astype(np.int32)).tobytes())
+    h.update(_canonical_segments(city.segments).astype(np.int32).tobytes())
+    return h.hexdigest()[:16]
+
+
+def _city(shape, seed, **kwargs):
+    width, height, block_size_range = shape
+    random.seed(seed)
+    city = City(width, height, block_size_range=block_size_range, **kwargs)
+    city.generateRoads()
+    return city
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_matches_baseline_generator(shape):
+    for seed, expected in enumerate(BASELINE[shape]):
+        assert _digest(_city(shape, seed)) == expected, seed
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('tile_size', [7, 13, 64])
+def test_band_size_does_not_change_the_map(shape, tile_size):
+    for seed in range(3):
+        reference = _city(shape, seed)
+        city = _city(shape, seed, tile_size=tile_size)
+        for name in LAYERS:
+            assert np.array_equal(np.asarray(getattr(city, name)), getattr(reference, name)), (seed, name)
+        assert city.num_segments == reference.num_segments
+
+
+def test_memmap_storage_matches_and_reloads(tmp_path):
+    shape = SHAPES[0]
+    reference = _city(shape, 1)
+    city = _city(shape, 1, storage=str(tmp_path), tile_size=13)
+    loaded = City.load(str(tmp_path), mode='r')
+    for name in LAYERS:
+        assert isinstance(getattr(city, name), np.memmap)
+        assert np.array_equal(np.asarray(getattr(city, name)), getattr(reference, name)), name
+        assert np.array_equal(np.asarray(getattr(loaded, name)), getattr(reference, name)), name
+    assert loaded.num_segments == reference.num_segments
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+import pytest
+
+from car import Car
+from grid import Grid
+from routing import LaneGraph, batch_routes
+
+
+@pytest.fixture(scope='module')
+def grid():
+    random.seed(4)
+    np.random.seed(4)
+    return Grid(150, 150)
+
+
+@pytest.fixture(scope='module')
+def pairs(grid):
+    rng = np.random.default_rng(4)
+    idx = grid.index
+    roads = np.flatnonzero(np.isin(idx.cell_type, (2, 4, 6)))
+    chosen = rng.choice(roads, (60, 2))
+    return (np.stack([idx.ys[chosen[:, 0]], idx.xs[chosen[:, 0]]], axis=1),
+            np.stack([idx.ys[chosen[:, 1]], idx.xs[chosen[:, 1]]], axis=1))
+
+
+def _a_star(grid, source, destination, cost=None):
+    car = Car(-1, tuple(source.tolist()), tuple(destination.tolist()), grid)
+    car.edge_cost = cost
+    car.compute_path()
+    grid.cell(source[0], source[1]).leaving()
+    return car.path
+
+
+def _paths(route, route_start):
+    return [[tuple(p) for p in route[route_start[k]:route_start[k + 1]].tolist()]
+            for k in range(len(route_start) - 1)]
+
+
+def test_batch_routes_match_car_a_star(grid, pairs):
+    sources, destinations = pairs
+    route, route_start = batch_routes(LaneGraph(grid.city, grid.index), sources, destinations, processes=1)
+    for k, path in enumerate(_paths(route, route_start)):
+        assert path == _a_star(grid, sources[k], destinations[k]), k
+
+
+def test_batch_routes_match_car_a_star_with_cost(grid, pairs):
+    sources, destinations = pairs
+    cost = np.random.default_rng(5).random(grid.index.size) + 1
+    route, route_start = batch_routes(grid.lane_graph, sources[:30], destinations[:30],
+                                      cost=cost, processes=1)
+    for k, path in enumerate(_paths(route, route_start)):
+        assert path == _a_star(grid, sources[k], destinations[k], cost), k
+
+
+def test_pool_matches_serial(grid, pairs):
+    sources, destinations = pairs
+    serial = batch_routes(grid.lane_graph, sources, destinations, processes=1)
+    pooled = batch_routes(grid.lane_graph, sources, destinations, processes=2, chunk_size=16)
+    assert np.array_equal(serial[0], pooled[0])
+    assert np.array_equal(serial[1], pooled[1])
@@ -0,0 +1,179 @@
+import json
+import os
+import numpy as np
+
+from fleet import ACTIVE, PARKED, ARRIVED, FINISHED  # car states stored per tick
+
+# One row per recorded tick: tick number, byte offset of its frame, number of cars
+INDEX_DTYPE = np.int64
+
+
+def _frame_size(cars, light_bytes):
+    # int32 (y, x) per car, uint8 state per car, packed light bits, padded to 4 bytes
+    size = cars * 9 + light_bytes
+    return size + (-size) % 4
+
+
+class TrajectoryRecorder:
+    """Append-only recording of car positions, car states and light phases.
+
+    A recording is a directory holding the static map (road cell ids,
+    coordinates and classes), frames.bin with one frame per recorded tick
+    and ticks.bin with one (tick, offset, cars) row per frame. Frames are
+    buffered and written chunk_ticks at a time; the index rows of a chunk
+    are appended only after its frames, so a reader never sees a tick whose
+    data is not on disk yet.
+
+    Car k in a frame is the k-th car of grid.cars. Cars added later simply
+    make later frames longer.
+    """
+
+    def __init__(self, path, grid, chunk_ticks=64):
+        self.path = path
+        self.chunk_ticks = chunk_ticks
+        os.makedirs(path, exist_ok=True)
+
+        index = grid.index
+        self.lights = index.lights[index.cell_type[index.lights] == 3]
+        self.light_bytes = (len(self.lights) + 7) // 8
+        np.save(os.path.join(path, 'roads.npy'), np.stack([index.ys, index.xs, index.cell_type]))
+        np.save(os.path.join(path, 'lights.npy'), self.lights)
+        with open(os.path.join(path, 'trajectory.json'), 'w') as f:
+            json.dump({'height': grid.height, 'width': grid.width, 'lights': len(self.lights)}, f)
+
+        self._frames = open(os.path.join(path, 'frames.bin'), 'wb')
+        self._ticks = open(os.path.join(path, 'ticks.bin'), 'wb')
+        self._offset = 0
+        self._chunk = []
+        self._rows = []
+
+    def record(self, tick, fleet, index):
+        """Buffer one frame from a FleetSnapshot and the index's light state."""
+        n = len(fleet)
+        frame = np.zeros(_frame_size(n, self.light_bytes), dtype=np.uint8)
+        frame[:n * 8] = np.ascontiguousarray(fleet.positions).view(np.uint8).reshape(-1)
+        frame[n * 8:n * 9] = fleet.state
+        frame[n * 9:n * 9 + self.light_bytes] = np.packbits(index.green[self.lights])
+
+        self._chunk.append(frame)
+        self._rows.append((tick, self._offset, n))
+        self._offset += len(frame)
+        if len(self._chunk) >= self.chunk_ticks:
+            self.flush()
+
+    def flush(self):
+        if not self._chunk:
+            return
+        self._frames.write(np.concatenate(self._chunk).tobytes())
+        self._frames.flush()
+        self._ticks.write(np.array(self._rows, dtype=INDEX_DTYPE).tobytes())
+        self._ticks.flush()
+        self._chunk, self._rows = [], []
+
+    def close(self):
+        self.flush()
+        self._frames.close()
+        self._ticks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """Random access to a recording written by TrajectoryRecorder.
+
+    frames.bin is memory-mapped, so reading one tick or a range of cars
+    touches only those bytes. Call refresh() to pick up ticks appended by
+    a recorder that is still running.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'trajectory.json')) as f:
+            meta = json.load(f)
+        self.height, self.width = meta['height'], meta['width']
+        self.ys, self.xs, self.cell_type = np.load(os.path.join(path, 'roads.npy'))
+        self.lights = np.load(os.path.join(path, 'lights.npy'))
+        self.light_bytes = (len(self.lights) + 7) // 8
+        self.refresh()
+
+    def refresh(self):
+        rows = np.fromfile(os.path.join(self.path, 'ticks.bin'), dtype=INDEX_DTYPE)
+        self.index = rows.reshape(-1, 3)
+        self.ticks = self.index[:, 0]
+        size = os.path.getsize(os.path.join(self.path, 'frames.bin'))
+        self._data = np.memmap(os.path.join(self.path, 'frames.bin'), dtype=np.uint8, mode='r') \
+            if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _row(self, tick):
+        i = np.searchsorted(self.ticks, tick)
+        if i == len(self.ticks) or self.ticks[i] != tick:
+            raise KeyError(f"Tick {tick} was not recorded")
+        _, offset, n = self.index[i]
+        return int(offset), int(n)
+
+    def num_cars(self, tick):
+        return self._row(tick)[1]
+
+    def positions(self, tick, cars=slice(None)):
+        """(y, x) of the given cars (slice or index array) at a tick."""
+        offset, n = self._row(tick)
+        raw = self._data[offset:offset + n * 8]
+        return raw.view(np.int32).reshape(n, 2)[cars]
+
+    def states(self, tick, cars=slice(None)):
+        offset, n = self._row(tick)
+        return self._data[offset + n * 8:offset + n * 9][cars]
+
+    def light_phases(self, tick):
+        """Green (True) or red per recorded light, aligned with self.lights."""
+        offset, n = self._row(tick)
+        start = offset + n * 9
+        return np.unpackbits(self._data[start:start + self.light_bytes])[:len(self.lights)].astype(bool)
+
+    def car_track(self, car, ticks=None):
+        """Positions of one car over the given ticks (all recorded ticks by default)."""
+        ticks = self.ticks if ticks is None else ticks
+        return np.array([self.positions(t)[car] if car < self.num_cars(t) else (-1, -1)
+                         for t in ticks], dtype=np.int32).reshape(-1, 2)
+
+    def image(self, tick):
+        """RGB frame at a tick, colored like Grid.get_image with cars on top."""
+        img = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
+        colors = np.full((len(self.ys), 3), 255, dtype=np.uint8)
+        colors[self.cell_type == 2] = [200, 200, 200]
+        colors[self.cell_type == 4] = [100, 100, 100]
+        colors[self.cell_type == 6] = [0, 0, 0]
+        green = self.light_phases(tick)
+        colors[self.lights[green]] = [0, 255, 0]
+        colors[self.lights[~green]] = [255, 0, 0]
+        img[self.ys, self.xs] = colors
+
+        on_road = self.states(tick) < ARRIVED
+        py, px = self.positions(tick)[on_road].T
+        img[py, px] = [255, 165, 0]
+        return img
+
+    def animate(self, ticks=None, interval=100):
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
+        ticks = self.ticks if ticks is None else ticks
+        fig, ax = plt.subplots(figsize=(8, 8))
+        im = ax.imshow(self.image(ticks[0]), animated=True)
+        ax.axis('off')
+
+        def update(frame):
+            im.set_array(self.image(ticks[frame]))
+            ax.set_title(f"Tick {ticks[frame]}")
+            return [im]
+
+        ani = animation.FuncAnimation(fig, update, frames=len(ticks), interval=interval, blit=False)
+        plt.show()
+        return ani